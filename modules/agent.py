@@ -1,12 +1,25 @@
 # modules/agent.py
 import os
 import json
-from datetime import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime
+from itertools import groupby
+from typing import Iterator
 from anthropic import Anthropic
 from dotenv import load_dotenv
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
-from .config import DEFAULT_CATEGORIES, TRANSACTION_TYPES
+from .config import (
+    DEFAULT_CATEGORIES,
+    TRANSACTION_TYPES,
+    AGENT_TOOL_WORKERS,
+    CHAT_HISTORY_MAX_TOKENS,
+    CHAT_KEEP_TURNS,
+)
 from . import db_utils
+from .form import format_currency_br_series
 
 load_dotenv()
 
@@ -108,8 +121,90 @@ TOOLS = [
 ]
 
 
-def _build_system_prompt(username: str, df) -> str:
-    cats_json = json.dumps(DEFAULT_CATEGORIES, ensure_ascii=False)
+def _records_for_model(df) -> list[dict]:
+    """Linhas de transações como dicts para o modelo, com data_hora e valor formatados em texto."""
+    out = df.drop(columns=['data_hora', 'data_hora_dt', 'valor_cents'], errors='ignore')
+    out['valor_formatado'] = format_currency_br_series(df['valor'])
+    out['data_hora'] = df['data_hora_dt'].dt.strftime("%Y-%m-%d %H:%M:%S")
+    return out.to_dict('records')
+
+
+# ---------------------------------------------------------------------------
+# Prompt caching
+# ---------------------------------------------------------------------------
+#
+# A API lê do cache o prefixo do prompt até cada breakpoint (`cache_control`)
+# se ele for idêntico ao de uma chamada recente. A ordem do prefixo é tools →
+# system → mensagens, então tudo o que é fixo (tools, instruções, categorias)
+# fica no início, com um breakpoint no fim de cada parte. O histórico vem em
+# seguida e só cresce no fim; o que muda a cada turno (usuário, horário,
+# bancos, últimas transações, resumo) vai num bloco depois da pergunta mais
+# recente, que recebe o terceiro breakpoint — assim o turno seguinte lê do
+# cache toda a conversa até ali. Um quarto breakpoint na última mensagem faz
+# as iterações de tool use do mesmo turno reaproveitarem o que já foi enviado.
+
+_CACHE_BREAKPOINT = {"type": "ephemeral"}
+
+_CACHED_TOOLS = [*TOOLS[:-1], {**TOOLS[-1], "cache_control": _CACHE_BREAKPOINT}]
+
+_INSTRUCTIONS = f"""Você é um assistente financeiro pessoal.
+
+Categorias disponíveis por tipo:
+{json.dumps(DEFAULT_CATEGORIES, ensure_ascii=False)}
+
+Seu trabalho:
+1. Quando o usuário descrever uma transação em linguagem natural, extraia os campos e chame create_transaction.
+2. Antes de chamar create_transaction, SEMPRE apresente um card resumo com os campos inferidos e peça confirmação.
+3. Somente chame create_transaction após o usuário confirmar (ex: "sim", "pode salvar", "confirma").
+4. Para consultas e resumos, use query_transactions e get_summary.
+5. Use português brasileiro. Seja direto e objetivo.
+6. Se algum campo essencial for ambíguo (ex: banco não mencionado), pergunte antes de inferir.
+
+O contexto do usuário (nome, data e hora atual, bancos cadastrados, últimas
+transações e, em conversas longas, um resumo dos turnos antigos) vem num bloco
+<contexto> logo depois da mensagem mais recente do usuário."""
+
+_SYSTEM = [{"type": "text", "text": _INSTRUCTIONS, "cache_control": _CACHE_BREAKPOINT}]
+
+
+@dataclass
+class PromptCacheStats:
+    """Tokens de entrada das chamadas ao modelo neste processo, por origem."""
+    calls: int = 0
+    uncached_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Fração dos tokens de entrada lida do cache."""
+        total = self.uncached_tokens + self.cache_read_tokens + self.cache_write_tokens
+        return self.cache_read_tokens / total if total else 0.0
+
+
+_prompt_cache_stats = PromptCacheStats()
+_stats_lock = threading.Lock()
+
+
+def _record_usage(usage) -> None:
+    with _stats_lock:
+        _prompt_cache_stats.calls += 1
+        _prompt_cache_stats.uncached_tokens += usage.input_tokens or 0
+        _prompt_cache_stats.cache_read_tokens += getattr(usage, "cache_read_input_tokens", 0) or 0
+        _prompt_cache_stats.cache_write_tokens += getattr(usage, "cache_creation_input_tokens", 0) or 0
+
+
+def prompt_cache_stats() -> PromptCacheStats:
+    """Cópia dos contadores de uso do cache de prompt."""
+    with _stats_lock:
+        return PromptCacheStats(**vars(_prompt_cache_stats))
+
+
+def _build_context(username: str, df, memory: str = "") -> str:
+    """
+    Contexto volátil do usuário para o turno atual, incluindo o resumo da
+    conversa (`memory`), se houver.
+    """
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     known_banks = []
@@ -118,28 +213,67 @@ def _build_system_prompt(username: str, df) -> str:
 
     recent_rows = ""
     if not df.empty:
-        sample = df.head(5)[['tipo', 'valor', 'categoria', 'banco', 'descricao', 'data_hora']].to_dict('records')
+        sample = _records_for_model(df.head(5)[['tipo', 'valor', 'categoria', 'banco', 'descricao', 'data_hora_dt']])
         recent_rows = json.dumps(sample, ensure_ascii=False, default=str)
 
-    return f"""Você é um assistente financeiro pessoal para {username}.
+    context = f"""Usuário: {username}
 Data e hora atual: {now}
 
-Categorias disponíveis por tipo:
-{cats_json}
-
 Bancos/instituições já cadastrados pelo usuário:
 {json.dumps(known_banks, ensure_ascii=False)}
 
 Últimas 5 transações do usuário (para inferir padrões):
-{recent_rows}
+{recent_rows}"""
+    if memory:
+        context += f"\n\nResumo dos turnos anteriores desta conversa:\n{memory}"
 
-Seu trabalho:
-1. Quando o usuário descrever uma transação em linguagem natural, extraia os campos e chame create_transaction.
-2. Antes de chamar create_transaction, SEMPRE apresente um card resumo com os campos inferidos e peça confirmação.
-3. Somente chame create_transaction após o usuário confirmar (ex: "sim", "pode salvar", "confirma").
-4. Para consultas e resumos, use query_transactions e get_summary.
-5. Use português brasileiro. Seja direto e objetivo.
-6. Se algum campo essencial for ambíguo (ex: banco não mencionado), pergunte antes de inferir."""
+    return f"<contexto>\n{context}\n</contexto>"
+
+
+def _with_context(messages: list, context: str) -> list:
+    """
+    Cópia de `messages` com o contexto como bloco extra da última mensagem (a
+    pergunta do usuário que abre o turno) e um breakpoint antes dele. No turno
+    seguinte essa mensagem volta sem o contexto, e o prefixo até o breakpoint
+    continua igual.
+    """
+    if not messages:
+        return messages
+    last = messages[-1]
+    content = last["content"]
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    content = [
+        *content[:-1],
+        {**content[-1], "cache_control": _CACHE_BREAKPOINT},
+        {"type": "text", "text": context},
+    ]
+    return [*messages[:-1], {**last, "content": content}]
+
+
+def _with_message_breakpoint(messages: list) -> list:
+    """
+    Cópia de `messages` com cache_control no último bloco da última mensagem
+    (sempre do usuário: texto ou tool_results). As mensagens originais não mudam.
+    """
+    if not messages:
+        return messages
+    last = messages[-1]
+    content = last["content"]
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    content = [*content[:-1], {**content[-1], "cache_control": _CACHE_BREAKPOINT}]
+    return [*messages[:-1], {**last, "content": content}]
+
+
+def _parse_date_range(tool_input: dict) -> tuple[date | None, date | None]:
+    """Converte start_date/end_date (YYYY-MM-DD) das tools em datas; ausentes viram None."""
+    start = tool_input.get("start_date")
+    end = tool_input.get("end_date")
+    return (
+        datetime.strptime(start, "%Y-%m-%d").date() if start else None,
+        datetime.strptime(end, "%Y-%m-%d").date() if end else None,
+    )
 
 
 def _execute_tool(tool_name: str, tool_input: dict, username: str, df) -> str:
@@ -164,84 +298,249 @@ def _execute_tool(tool_name: str, tool_input: dict, username: str, df) -> str:
         return json.dumps({"status": "error", "message": "Erro ao salvar no banco."})
 
     elif tool_name == "query_transactions":
-        if df.empty:
+        try:
+            start, end = _parse_date_range(tool_input)
+        except ValueError:
+            return json.dumps({"error": "Datas devem estar no formato YYYY-MM-DD."})
+        filtered = db_utils.get_transactions_for_user(
+            username,
+            start=start,
+            end=end,
+            tipo=tool_input.get("tipo"),
+            categoria=tool_input.get("categoria"),
+            limit=50,
+        )
+        if filtered.empty:
             return json.dumps({"transactions": []})
-        filtered = df.copy()
-        if tool_input.get("start_date"):
-            filtered = filtered[filtered['data_hora'] >= tool_input["start_date"]]
-        if tool_input.get("end_date"):
-            filtered = filtered[filtered['data_hora'] <= tool_input["end_date"] + " 23:59:59"]
-        if tool_input.get("tipo"):
-            filtered = filtered[filtered['tipo'].str.lower() == tool_input["tipo"].lower()]
-        if tool_input.get("categoria"):
-            filtered = filtered[filtered['categoria'].str.lower() == tool_input["categoria"].lower()]
-        records = filtered.head(50).to_dict('records')
+        records = _records_for_model(filtered)
         return json.dumps({"transactions": records}, ensure_ascii=False, default=str)
 
     elif tool_name == "get_summary":
-        if df.empty:
-            return json.dumps({"receitas": 0, "gastos": 0, "investimentos": 0, "saldo": 0})
-        filtered = df.copy()
-        if tool_input.get("start_date"):
-            filtered = filtered[filtered['data_hora'] >= tool_input["start_date"]]
-        if tool_input.get("end_date"):
-            filtered = filtered[filtered['data_hora'] <= tool_input["end_date"] + " 23:59:59"]
-        receitas = float(filtered[filtered['tipo'] == 'receita']['valor'].sum())
-        gastos = float(filtered[filtered['tipo'] == 'gasto']['valor'].sum())
-        investimentos = float(filtered[filtered['tipo'] == 'investimento']['valor'].sum())
-        return json.dumps({
+        try:
+            start, end = _parse_date_range(tool_input)
+        except ValueError:
+            return json.dumps({"error": "Datas devem estar no formato YYYY-MM-DD."})
+        totals = db_utils.summarize_transactions(username, start=start, end=end)
+        receitas = totals.get('receita', 0.0)
+        gastos = totals.get('gasto', 0.0)
+        investimentos = totals.get('investimento', 0.0)
+        summary = {
             "receitas": receitas,
             "gastos": gastos,
             "investimentos": investimentos,
             "saldo": receitas - gastos - investimentos
-        })
+        }
+        summary["formatado"] = dict(zip(summary, format_currency_br_series(list(summary.values()))))
+        return json.dumps(summary, ensure_ascii=False)
 
     return json.dumps({"error": f"Tool desconhecida: {tool_name}"})
 
 
-def chat(messages: list, username: str, df) -> tuple[str, bool]:
+# Tools que só leem o banco: chamadas consecutivas delas numa mesma resposta
+# rodam em paralelo no pool. As demais (create_transaction) rodam sozinhas e
+# na ordem, funcionando como barreira entre os grupos de leitura.
+_READ_ONLY_TOOLS = {"query_transactions", "get_summary"}
+
+_tool_pool = ThreadPoolExecutor(max_workers=AGENT_TOOL_WORKERS, thread_name_prefix="agent-tool")
+
+
+def _execute_reads(calls: list, username: str, df) -> list[str]:
+    """Executa tools somente leitura em paralelo; resultados na ordem de `calls`."""
+    if len(calls) == 1:
+        return [_execute_tool(calls[0].name, calls[0].input, username, df)]
+
+    # Contexto do Streamlit nas threads do pool, para que st.error das
+    # leituras continue aparecendo na sessão que fez a pergunta.
+    ctx = get_script_run_ctx()
+
+    def run(call) -> str:
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return _execute_tool(call.name, call.input, username, df)
+
+    return list(_tool_pool.map(run, calls))
+
+
+def _run_tools(blocks, username: str, df) -> tuple[list[dict], bool]:
     """
-    Processa uma rodada do chat com o agente.
-    Retorna (resposta_texto, transaction_saved).
+    Executa os blocos tool_use de uma resposta e retorna (tool_results na
+    ordem dos blocos, se alguma transação foi salva).
+    """
+    calls = [block for block in blocks if block.type == "tool_use"]
+    results: list[str] = []
+    for read_only, group in groupby(calls, key=lambda call: call.name in _READ_ONLY_TOOLS):
+        group = list(group)
+        if read_only:
+            results += _execute_reads(group, username, df)
+        else:
+            results += [_execute_tool(call.name, call.input, username, df) for call in group]
+
+    tool_results = []
+    transaction_saved = False
+    for call, result_str in zip(calls, results):
+        if call.name == "create_transaction":
+            result_data = json.loads(result_str)
+            if result_data.get("status") == "ok":
+                transaction_saved = True
+        tool_results.append({
+            "type": "tool_result",
+            "tool_use_id": call.id,
+            "content": result_str
+        })
+    return tool_results, transaction_saved
+
+
+# ---------------------------------------------------------------------------
+# Histórico da conversa
+# ---------------------------------------------------------------------------
+#
+# O histórico guardado na sessão só tem textos (pergunta do usuário e resposta
+# final). Quando ele passa de CHAT_HISTORY_MAX_TOKENS, os turnos mais antigos
+# que os últimos CHAT_KEEP_TURNS são resumidos num bloco de memória que vai no
+# contexto do turno, então o que é enviado a cada chamada não cresce com a sessão.
+# Resultados de tools só existem dentro do turno e são enviados inteiros: mudá-los
+# entre iterações invalidaria o cache da conversa (ver "Prompt caching").
+
+def estimate_tokens(messages: list) -> int:
+    """Estimativa local de tokens (~4 caracteres por token), sem chamar a API."""
+    return sum(len(json.dumps(m["content"], ensure_ascii=False, default=str)) for m in messages) // 4
+
+
+def _turn_starts(messages: list) -> list[int]:
+    """Índices das mensagens que abrem um turno (texto do usuário)."""
+    return [i for i, m in enumerate(messages) if m["role"] == "user" and isinstance(m["content"], str)]
+
+
+def _transcript(messages: list) -> str:
+    speaker = {"user": "Usuário", "assistant": "Assistente"}
+    return "\n".join(
+        f"{speaker[m['role']]}: {m['content']}" for m in messages if isinstance(m["content"], str)
+    )
+
+
+def _summarize(memory: str, messages: list) -> str:
+    """
+    Novo bloco de memória: o resumo anterior mais os turnos em `messages`.
+    Usa um modelo rápido; se a chamada falhar, cai para um resumo local com o
+    começo de cada mensagem.
+    """
+    transcript = _transcript(messages)
+    try:
+        response = _get_client().messages.create(
+            model="claude-haiku-4-5",
+            max_tokens=512,
+            system=(
+                "Resuma a conversa entre um usuário e seu assistente financeiro em até 10 "
+                "tópicos curtos, em português. Preserve valores, datas, bancos, categorias, "
+                "transações salvas e pedidos ainda pendentes; descarte cumprimentos."
+            ),
+            messages=[{
+                "role": "user",
+                "content": f"Resumo anterior:\n{memory or '(nenhum)'}\n\nTurnos novos:\n{transcript}",
+            }],
+        )
+        _record_usage(response.usage)
+        return "\n".join(b.text for b in response.content if hasattr(b, "text")).strip()
+    except Exception:
+        lines = memory.splitlines() + [line[:160] for line in transcript.splitlines() if line.strip()]
+        return "\n".join(lines[-20:])
+
+
+def compact_history(messages: list, memory: str = "") -> tuple[list, str]:
+    """
+    Mantém o histórico dentro do orçamento: se `messages` passa de
+    CHAT_HISTORY_MAX_TOKENS, os turnos anteriores aos últimos CHAT_KEEP_TURNS
+    saem da lista e entram no resumo. Retorna (mensagens mantidas, memória).
+    """
+    if estimate_tokens(messages) <= CHAT_HISTORY_MAX_TOKENS:
+        return messages, memory
+    starts = _turn_starts(messages)
+    if len(starts) <= CHAT_KEEP_TURNS:
+        return messages, memory
+    cut = starts[-CHAT_KEEP_TURNS]
+    return messages[cut:], _summarize(memory, messages[:cut])
+
+
+# ---------------------------------------------------------------------------
+# Loop do agente
+# ---------------------------------------------------------------------------
+#
+# chat_stream é o loop agentic completo, emitindo eventos à medida que chegam:
+# pedaços de texto do modelo, o início de cada tool e, no fim, a resposta
+# final. chat() consome o mesmo gerador e devolve só o resultado.
+
+@dataclass
+class TextDelta:
+    """Trecho de texto do modelo, na ordem em que foi gerado."""
+    text: str
+
+
+@dataclass
+class ToolStarted:
+    """O agente vai executar uma tool."""
+    name: str
+    input: dict
+
+
+@dataclass
+class TurnFinished:
+    """Fim do turno: texto da última resposta do modelo e se alguma transação foi salva."""
+    text: str
+    transaction_saved: bool
+
+
+AgentEvent = TextDelta | ToolStarted | TurnFinished
+
+
+def chat_stream(messages: list, username: str, df, memory: str = "") -> Iterator[AgentEvent]:
+    """
+    Processa uma rodada do chat com o agente, emitindo o texto token a token.
+    O último evento é sempre TurnFinished.
     messages: lista de dicts {role, content} no formato Anthropic.
+    memory: resumo dos turnos antigos (ver compact_history).
     """
     client = _get_client()
-    system = _build_system_prompt(username, df)
     transaction_saved = False
 
-    working_messages = list(messages)
+    working_messages = _with_context(messages, _build_context(username, df, memory))
 
     while True:
-        response = client.messages.create(
+        with client.messages.stream(
             model="claude-sonnet-4-6",
             max_tokens=2048,
-            system=system,
-            tools=TOOLS,
-            messages=working_messages,
-        )
+            system=_SYSTEM,
+            tools=_CACHED_TOOLS,
+            messages=_with_message_breakpoint(working_messages),
+        ) as stream:
+            for event in stream:
+                if event.type == "text":
+                    yield TextDelta(event.text)
+            response = stream.get_final_message()
+        _record_usage(response.usage)
 
         if response.stop_reason == "tool_use":
-            tool_results = []
-            assistant_content = response.content
-
             for block in response.content:
                 if block.type == "tool_use":
-                    result_str = _execute_tool(block.name, block.input, username, df)
-                    if block.name == "create_transaction":
-                        result_data = json.loads(result_str)
-                        if result_data.get("status") == "ok":
-                            transaction_saved = True
-                    tool_results.append({
-                        "type": "tool_result",
-                        "tool_use_id": block.id,
-                        "content": result_str
-                    })
+                    yield ToolStarted(block.name, block.input)
+            tool_results, saved = _run_tools(response.content, username, df)
+            transaction_saved = transaction_saved or saved
 
             working_messages = working_messages + [
-                {"role": "assistant", "content": assistant_content},
+                {"role": "assistant", "content": response.content},
                 {"role": "user", "content": tool_results}
             ]
             continue
 
         text_parts = [b.text for b in response.content if hasattr(b, "text")]
-        return "\n".join(text_parts), transaction_saved
+        yield TurnFinished("\n".join(text_parts), transaction_saved)
+        return
+
+
+def chat(messages: list, username: str, df, memory: str = "") -> tuple[str, bool]:
+    """
+    Processa uma rodada do chat com o agente.
+    Retorna (resposta_texto, transaction_saved).
+    messages: lista de dicts {role, content} no formato Anthropic.
+    """
+    for event in chat_stream(messages, username, df, memory):
+        if isinstance(event, TurnFinished):
+            return event.text, event.transaction_saved
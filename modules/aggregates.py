@@ -0,0 +1,150 @@
+# modules/aggregates.py
+from functools import cached_property
+from typing import Sequence
+
+import pandas as pd
+
+from .config import CHART_OTHERS_LABEL
+
+
+# ---------------------------------------------------------------------------
+# Nível de detalhe (top-N + "Outros")
+# ---------------------------------------------------------------------------
+#
+# Usado pelos três gráficos de alta cardinalidade do dashboard: o Sankey, a
+# pizza de receitas por descrição e as barras de gastos por banco. Cada um
+# agrega seus totais por grupo e passa por `fold_top_n` antes de ir ao Plotly,
+# então nenhum deles envia mais do que N + 1 elementos por partição.
+
+def fold_top_n(
+    totals: pd.DataFrame,
+    group_col: str,
+    n: int | None,
+    value_col: str = "valor",
+    by: Sequence[str] = (),
+    other_label: str = CHART_OTHERS_LABEL,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Mantém os `n` maiores grupos de cada partição `by` e soma o restante numa
+    linha `other_label`, a última da partição. Um grupo que já se chame
+    `other_label` (ex.: a categoria "Outros") entra na soma do restante.
+
+    Retorna (linhas para o gráfico, linhas agrupadas em `other_label`), ambas
+    ordenadas por valor decrescente dentro de cada partição. Com `n` vazio ou
+    zero nada é agrupado.
+    """
+    by = list(by)
+    ordered = totals.sort_values([*by, value_col], ascending=[True] * len(by) + [False], kind="stable")
+    if not n or ordered.empty:
+        return ordered.reset_index(drop=True), ordered.iloc[0:0]
+
+    eligible = ordered[group_col] != other_label
+    rank = eligible.groupby([ordered[col] for col in by]).cumsum() if by else eligible.cumsum()
+    keep = (eligible & (rank <= n)).to_numpy()
+    tail = ordered[~keep]
+    if tail.empty:
+        return ordered.reset_index(drop=True), tail
+
+    if by:
+        others = tail.groupby(by, sort=False)[value_col].sum().reset_index()
+    else:
+        others = pd.DataFrame({value_col: [tail[value_col].sum()]})
+    others[group_col] = other_label
+
+    folded = pd.concat(
+        [ordered[keep].assign(_outros=False), others.assign(_outros=True)], ignore_index=True
+    )
+    sort_cols = [*by, "_outros", value_col]
+    folded = folded.sort_values(
+        sort_cols, ascending=[True] * (len(by) + 1) + [False], kind="stable", ignore_index=True
+    )
+    return folded[list(totals.columns)], tail.reset_index(drop=True)
+
+
+
+# ---------------------------------------------------------------------------
+# Agregados do dashboard
+# ---------------------------------------------------------------------------
+
+FLOW_TIPOS = ("receita", "gasto", "investimento")
+NO_GROUP_LABEL = "Sem categoria"
+
+
+class DashboardAggregates:
+    """
+    Todos os números do dashboard a partir de uma única passada no período.
+
+    O construtor normaliza `tipo` uma vez e agrupa as transações por
+    (tipo, categoria, banco, descricao) — um "cubo" com uma linha por
+    combinação distinta, bem menor que o período. Totais por tipo, gastos por
+    banco, receitas por descrição e os grupos do Sankey são derivados desse
+    cubo sob demanda e memorizados. Não depende do Streamlit.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        if df.empty:
+            self.cube = pd.DataFrame(
+                {"tipo": [], "categoria": [], "banco": [], "descricao": [], "valor": []}
+            ).astype({"valor": float})
+            return
+        # Colunas categóricas agrupam pelos códigos; o cubo volta a texto comum.
+        keys = [df["tipo"].str.lower().rename("tipo")] + [
+            df[col] for col in ("categoria", "banco", "descricao")
+        ]
+        cube = df["valor"].groupby(keys, sort=False, observed=True, dropna=False).sum().reset_index()
+        for col in ("tipo", "categoria", "banco", "descricao"):
+            cube[col] = cube[col].astype(object).fillna("").astype(str)
+        self.cube = cube
+
+    def _of_tipo(self, tipo: str) -> pd.DataFrame:
+        return self.cube[self.cube["tipo"] == tipo]
+
+    def _totals_by(self, tipo: str, column: str) -> pd.DataFrame:
+        return (
+            self._of_tipo(tipo).groupby(column)["valor"].sum()
+            .sort_values(ascending=False).reset_index()
+        )
+
+    @cached_property
+    def totals(self) -> dict[str, float]:
+        """Soma dos valores por tipo ('receita', 'gasto', 'investimento', ...)."""
+        return self.cube.groupby("tipo")["valor"].sum().to_dict()
+
+    @cached_property
+    def gastos_por_banco(self) -> pd.DataFrame:
+        """Colunas banco, valor — gastos por banco, maiores primeiro."""
+        return self._totals_by("gasto", "banco")
+
+    @cached_property
+    def receitas_por_descricao(self) -> pd.DataFrame:
+        """Colunas descricao, valor — receitas por descrição, maiores primeiro."""
+        return self._totals_by("receita", "descricao")
+
+    def group_labels(self, cube: pd.DataFrame, group_col: str) -> pd.Series:
+        """
+        Rótulo do Sankey de cada linha do cubo: a coluna escolhida, com
+        descricao no lugar de categoria vazia e NO_GROUP_LABEL se nada sobrar.
+        """
+        labels = cube[group_col]
+        if group_col == "categoria":
+            labels = labels.where(labels != "", cube["descricao"])
+        return labels.where(labels != "", NO_GROUP_LABEL)
+
+    def sankey_flows(self, group_col: str) -> pd.DataFrame:
+        """
+        Uma linha por folha do Sankey (colunas tipo, grupo, valor), em ordem de
+        FLOW_TIPOS e, dentro de cada tipo, por valor decrescente.
+        """
+        sub = self.cube[self.cube["tipo"].isin(FLOW_TIPOS)]
+        flows = (
+            sub["valor"]
+            .groupby([sub["tipo"], self.group_labels(sub, group_col).rename("grupo")])
+            .sum()
+            .reset_index()
+        )
+        order = flows["tipo"].map({tipo: i for i, tipo in enumerate(FLOW_TIPOS)})
+        return (
+            flows.assign(_ordem=order)
+            .sort_values(["_ordem", "valor"], ascending=[True, False], kind="stable", ignore_index=True)
+            .drop(columns="_ordem")
+        )
@@ -0,0 +1,124 @@
+# modules/cache.py
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable
+
+import pandas as pd
+
+
+# ---------------------------------------------------------------------------
+# Cache LRU limitado por memória
+# ---------------------------------------------------------------------------
+#
+# Usado por db_utils para guardar o resultado das leituras entre reruns do
+# Streamlit. As chaves incluem a versão dos dados do usuário, então uma
+# escrita nunca precisa atualizar entradas: as antigas deixam de ser pedidas
+# e saem pelo LRU (ou são descartadas explicitamente com `discard_where`).
+
+@dataclass(frozen=True)
+class CacheStats:
+    hits: int
+    misses: int
+    entries: int
+    size_bytes: int
+    max_bytes: int | None
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def estimate_size(value: Any) -> int:
+    """Tamanho aproximado em bytes de um valor guardado no cache."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    return sys.getsizeof(value)
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Mapa chave → valor com despejo do item menos usado quando o total estimado
+    passa de `max_bytes` ou o número de itens passa de `max_entries` (limites
+    None são ignorados). Seguro entre threads; o carregamento de um valor
+    ausente roda fora do lock, então dois misses simultâneos podem carregar
+    a mesma chave (o último a terminar prevalece).
+    """
+
+    def __init__(self, max_bytes: int | None = None, max_entries: int | None = None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._items: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self._misses += 1
+                return default
+            self._items.move_to_end(key)
+            self._hits += 1
+            return item[0]
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.put(key, value)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = estimate_size(value)
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._items[key] = (value, size)
+            self._size += size
+            while self._over_limit():
+                _, (_, evicted) = self._items.popitem(last=False)
+                self._size -= evicted
+
+    def _over_limit(self) -> bool:
+        return (
+            (self.max_bytes is not None and self._size > self.max_bytes)
+            or (self.max_entries is not None and len(self._items) > self.max_entries)
+        )
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        """Remove as entradas cujas chaves satisfazem `predicate`."""
+        with self._lock:
+            for key in [key for key in self._items if predicate(key)]:
+                self._size -= self._items.pop(key)[1]
+
+    def entries(self) -> list[tuple[Hashable, Any, int]]:
+        """(chave, valor, tamanho estimado) de cada item, do menos para o mais usado."""
+        with self._lock:
+            return [(key, value, size) for key, (value, size) in self._items.items()]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                entries=len(self._items),
+                size_bytes=self._size,
+                max_bytes=self.max_bytes,
+            )
@@ -1,15 +1,93 @@
 # modules/chat.py
 import streamlit as st
 from . import db_utils, agent
+from .config import FAST_PARSE_MIN_CONFIDENCE
+from .form import format_currency_br
+from .nl_parser import parse_transaction, is_confirmation
 
 CHAT_ICON = "🤖"
 
+_TOOL_LABELS = {
+    "create_transaction": "Salvando transação",
+    "query_transactions": "Consultando transações",
+    "get_summary": "Calculando resumo",
+}
+
+
+def _render_stream(events) -> tuple[str, str, bool]:
+    """
+    Mostra os eventos do agente à medida que chegam: o texto vai sendo
+    escrito no placeholder atual e cada tool ganha uma legenda própria.
+    Retorna (texto exibido, resposta final para a API, transaction_saved).
+    """
+    shown = ""
+    segment = ""
+    placeholder = st.empty()
+    for event in events:
+        if isinstance(event, agent.TextDelta):
+            segment += event.text
+            placeholder.markdown(segment + "▌")
+        elif isinstance(event, agent.ToolStarted):
+            placeholder.markdown(segment)
+            if segment:
+                shown += segment + "\n\n"
+            segment = ""
+            st.caption(f"🔧 {_TOOL_LABELS.get(event.name, event.name)}...")
+            placeholder = st.empty()
+        elif isinstance(event, agent.TurnFinished):
+            placeholder.markdown(segment)
+            return shown + segment, event.text, event.transaction_saved
+    return shown + segment, shown + segment, False
+
+
+def _confirmation_card(transaction: dict) -> str:
+    """Card de confirmação do parser local, no mesmo formato pedido ao agente."""
+    return (
+        "Entendi a seguinte transação:\n\n"
+        f"- **Tipo:** {transaction['tipo']}\n"
+        f"- **Valor:** {format_currency_br(transaction['valor'])}\n"
+        f"- **Categoria:** {transaction['categoria']}\n"
+        f"- **Banco:** {transaction['banco']}\n"
+        f"- **Pagamento:** {transaction['tipo_cartao']}\n"
+        f"- **Descrição:** {transaction['descricao']}\n"
+        f"- **Data:** {transaction['data_hora']:%d/%m/%Y %H:%M}\n\n"
+        "Responda **sim** para salvar ou descreva o que ajustar."
+    )
+
+
+def _local_reply(user_input: str, username: str, known_banks: list[str]) -> tuple[str, bool] | None:
+    """
+    Resposta sem chamar o modelo: salva a transação pendente quando o usuário
+    confirma, ou mostra o card de uma transação simples reconhecida com
+    confiança suficiente. Retorna (resposta, transaction_saved) ou None para
+    seguir para o agente — inclusive quando há uma transação pendente e a
+    resposta não é só uma confirmação (ex.: um ajuste no card).
+    """
+    pending = st.session_state["chat_pending"]
+    st.session_state["chat_pending"] = None
+    if pending:
+        if not is_confirmation(user_input):
+            return None
+        if db_utils.insert_transaction(username, pending):
+            return "Transação salva com sucesso.", True
+        return "Não consegui salvar a transação.", False
+
+    parsed = parse_transaction(user_input, known_banks)
+    if parsed is None or parsed.confidence < FAST_PARSE_MIN_CONFIDENCE:
+        return None
+    st.session_state["chat_pending"] = parsed.transaction
+    return _confirmation_card(parsed.transaction), False
+
 
 def _init_chat_state():
     if "chat_messages" not in st.session_state:
         st.session_state["chat_messages"] = []
     if "chat_api_messages" not in st.session_state:
         st.session_state["chat_api_messages"] = []
+    if "chat_memory" not in st.session_state:
+        st.session_state["chat_memory"] = ""
+    if "chat_pending" not in st.session_state:
+        st.session_state["chat_pending"] = None
 
 
 def chat_page(username: str):
@@ -24,7 +102,15 @@ def chat_page(username: str):
         st.code("ANTHROPIC_API_KEY=sk-ant-...")
         return
 
-    df = db_utils.get_transactions_for_user(username)
+    df = db_utils.get_synced_transactions(username)
+    known_banks = df["banco"].dropna().unique().tolist() if not df.empty else []
+
+    stats = agent.prompt_cache_stats()
+    if stats.calls:
+        st.sidebar.caption(
+            f"Cache do prompt: {stats.hit_rate:.0%} dos tokens de entrada "
+            f"lidos do cache em {stats.calls} chamadas."
+        )
 
     # Render histórico
     for msg in st.session_state["chat_messages"]:
@@ -41,23 +127,35 @@ def chat_page(username: str):
             st.markdown(user_input)
 
         with st.chat_message("assistant"):
-            with st.spinner("Pensando..."):
+            # O card e a confirmação locais também entram no histórico da API,
+            # então o agente enxerga a conversa completa se for chamado depois.
+            local = _local_reply(user_input, username, known_banks)
+            if local is not None:
+                reply, saved = local
+                shown = reply
+                st.markdown(reply)
+            else:
+                # Só o histórico enviado à API é compactado, e só quando o modelo
+                # vai ser chamado: o caminho local não faz nenhuma chamada à API.
+                # A tela mantém a conversa inteira.
+                st.session_state["chat_api_messages"], st.session_state["chat_memory"] = agent.compact_history(
+                    st.session_state["chat_api_messages"], st.session_state["chat_memory"]
+                )
                 try:
-                    reply, saved = agent.chat(
-                        st.session_state["chat_api_messages"],
-                        username,
-                        df,
+                    shown, reply, saved = _render_stream(
+                        agent.chat_stream(
+                            st.session_state["chat_api_messages"], username, df, st.session_state["chat_memory"]
+                        )
                     )
                 except Exception as e:
-                    reply = f"Erro ao contatar a API: {e}"
+                    reply = shown = f"Erro ao contatar a API: {e}"
                     saved = False
-
-            st.markdown(reply)
+                    st.markdown(reply)
 
             if saved:
                 st.success("Transação salva! Dashboard atualizado.")
 
-        st.session_state["chat_messages"].append({"role": "assistant", "content": reply})
+        st.session_state["chat_messages"].append({"role": "assistant", "content": shown})
         st.session_state["chat_api_messages"].append({"role": "assistant", "content": reply})
 
         if saved:
@@ -67,4 +165,6 @@ def chat_page(username: str):
         if st.button("Limpar conversa", key="clear_chat"):
             st.session_state["chat_messages"] = []
             st.session_state["chat_api_messages"] = []
+            st.session_state["chat_memory"] = ""
+            st.session_state["chat_pending"] = None
             st.rerun()
@@ -1,7 +1,41 @@
 # modules/config.py
 import os
+from dotenv import load_dotenv
+
+load_dotenv()
 
 DB_MASTER_NAME = 'gerenciador_financas.db'
+
+# Pool de conexões SQLite
+DB_POOL_SIZE = 8           # conexões mantidas abertas por processo
+DB_BUSY_TIMEOUT = 30       # segundos aguardando um lock de escrita antes de falhar
+DB_PRAGMAS = {
+    "journal_mode": "WAL",     # leitores não bloqueiam o escritor (persistente no arquivo)
+    "synchronous": "NORMAL",   # seguro com WAL e evita um fsync por commit
+    "cache_size": -16000,      # ~16 MiB de page cache por conexão (negativo = KiB)
+    "mmap_size": 268435456,    # 256 MiB de leitura via mmap
+    "temp_store": "MEMORY",
+}
+
+# Formato compacto (valor_cents INTEGER, ts INTEGER) para tabelas novas.
+# Tabelas existentes são convertidas com `python -m modules.maintenance compactar`.
+COMPACT_STORAGE = os.environ.get("FINANCE_COMPACT_STORAGE", "").lower() in ("1", "true", "sim")
+
+# Usuários novos gravam na tabela compartilhada `transactions` (chave user_id)
+# em vez de ganhar uma tabela própria. Tabelas por usuário existentes são
+# movidas com `python -m modules.maintenance unificar`.
+SHARED_STORAGE = os.environ.get("FINANCE_SHARED_STORAGE", "").lower() in ("1", "true", "sim")
+
+# Cache de leituras (DataFrames por usuário e versão dos dados), compartilhado
+# por todas as sessões do processo e limitado pelo tamanho estimado em memória.
+FRAME_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Colunas de texto com poucos valores distintos, carregadas como categóricas
+CATEGORICAL_COLUMNS = ["tipo", "tipo_cartao", "banco", "categoria"]
+
+# Figuras e agregados do dashboard memorizados por (usuário, versão dos dados, período, opções)
+FIGURE_CACHE_ENTRIES = 64
+
 FORM_ICON = "📝"
 DASHBOARD_ICON = "📊"
 CHAT_ICON = "🤖"
@@ -50,6 +84,12 @@ SANKEY_GROUP_LABELS = {
     "descricao": "Descrição",
 }
 
+# Nível de detalhe dos gráficos (Sankey, pizza de receitas, barras por banco):
+# os N maiores grupos aparecem e o restante é somado em CHART_OTHERS_LABEL.
+CHART_TOP_N = 10
+CHART_TOP_N_OPTIONS = [5, 10, 15, 25, 50, 0]   # 0 = mostrar todos
+CHART_OTHERS_LABEL = "Outros"
+
 # Colunas esperadas no upload CSV
 EXPECTED_UPLOAD_COLUMNS = [
     'tipo', 'valor', 'tipo_cartao', 'banco', 'descricao', 'categoria', 'data_hora'
@@ -58,6 +98,69 @@ EXPECTED_UPLOAD_COLUMNS = [
 UPLOAD_DATE_FORMAT     = '%d/%m/%Y'
 UPLOAD_DATETIME_FORMAT = '%d/%m/%Y %H:%M:%S'
 
+# Linhas lidas e gravadas por vez na importação de CSV (limita a memória do worker)
+UPLOAD_CHUNK_ROWS = 20_000
+
+# Linhas lidas do SQLite por vez ao gerar exportações (CSV, Parquet, XLSX)
+EXPORT_CHUNK_ROWS = 20_000
+
+# Tabela de transações do dashboard: páginas lidas do SQLite com cursor
+# (coluna de ordenação, id), sem OFFSET — o custo depende só do tamanho da página.
+TABLE_PAGE_SIZE = 50
+TABLE_PAGE_SIZE_OPTIONS = [25, 50, 100, 250]
+TABLE_SORT_LABELS = {
+    "data_hora": "Data/Hora",
+    "valor":     "Valor",
+    "descricao": "Descrição",
+    "banco":     "Banco",
+}
+
+# Máximo de transações listadas no seletor de edição/exclusão (busca no SQL)
+EDIT_SEARCH_LIMIT = 50
+
+# Threads do processo para executar em paralelo as tools somente leitura que o
+# agente pede numa mesma resposta (tools de escrita rodam uma por vez)
+AGENT_TOOL_WORKERS = 4
+
+# Histórico do chat enviado ao modelo: acima de CHAT_HISTORY_MAX_TOKENS
+# (estimados), os turnos além dos últimos CHAT_KEEP_TURNS viram um resumo.
+CHAT_HISTORY_MAX_TOKENS = 6_000
+CHAT_KEEP_TURNS = 6
+
+# Parser local do chat: entradas simples ("Gastei 45 reais no almoço hoje no
+# Nubank, débito") com confiança a partir deste valor mostram o card de
+# confirmação sem chamar o modelo
+FAST_PARSE_MIN_CONFIDENCE = 0.8
+
+# Palavras-chave → categoria, por tipo, usadas pelo parser local
+CATEGORY_KEYWORDS = {
+    "Gasto": {
+        "Alimentação": ["almoço", "jantar", "lanche", "café", "mercado", "supermercado", "restaurante",
+                        "ifood", "padaria", "pizza", "comida"],
+        "Moradia": ["aluguel", "condomínio", "luz", "energia", "água", "gás", "iptu"],
+        "Transporte": ["uber", "táxi", "ônibus", "metrô", "gasolina", "combustível", "estacionamento",
+                       "pedágio"],
+        "Saúde": ["farmácia", "remédio", "médico", "consulta", "dentista", "exame"],
+        "Educação": ["curso", "livro", "faculdade", "escola", "mensalidade"],
+        "Lazer": ["cinema", "show", "bar", "viagem", "passeio", "festa"],
+        "Vestuário": ["roupa", "roupas", "tênis", "sapato", "camisa", "calça"],
+        "Serviços & Assinaturas": ["netflix", "spotify", "assinatura", "academia", "internet", "celular"],
+    },
+    "Receita": {
+        "Salário": ["salário"],
+        "Freelance": ["freela", "freelance", "projeto"],
+        "Reembolso": ["reembolso", "estorno", "devolução"],
+        "Aluguel recebido": ["aluguel"],
+    },
+    "Investimento": {
+        "Renda Fixa": ["cdb", "tesouro", "lci", "lca", "renda fixa", "poupança"],
+        "Renda Variável": ["ações", "ação", "fii", "fiis", "bolsa"],
+        "Fundos": ["fundo", "fundos"],
+        "Criptoativos": ["bitcoin", "btc", "cripto", "ethereum"],
+        "Previdência": ["previdência", "pgbl", "vgbl"],
+    },
+}
+
 TRANSACTION_TEMPLATE_PATH = os.path.join(
     os.path.dirname(os.path.dirname(__file__)), 'transaction_template.csv'
 )
\ No newline at end of file
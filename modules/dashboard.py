@@ -1,9 +1,11 @@
 # modules/dashboard.py
 import streamlit as st  # type: ignore
+import numpy as np  # type: ignore
 import pandas as pd  # type: ignore
 import plotly.express as px  # type: ignore
 import plotly.graph_objects as go  # type: ignore
-from datetime import datetime, timedelta
+import math
+from datetime import date, datetime, timedelta
 from .config import (
     DASHBOARD_ICON,
     FORM_ICON,
@@ -15,150 +17,90 @@ from .config import (
     DEFAULT_CATEGORIES,
     SANKEY_GROUP_OPTIONS,
     SANKEY_GROUP_LABELS,
+    FIGURE_CACHE_ENTRIES,
+    CHART_TOP_N,
+    CHART_TOP_N_OPTIONS,
+    CHART_OTHERS_LABEL,
+    EDIT_SEARCH_LIMIT,
+    TABLE_PAGE_SIZE,
+    TABLE_PAGE_SIZE_OPTIONS,
+    TABLE_SORT_LABELS,
 )
-from . import db_utils
-from .form import format_currency_br
-from io import StringIO
+from . import aggregates, cache, db_utils, exporter, importer
+from .form import format_currency_br, format_currency_br_series
 
 
 # ---------------------------------------------------------------------------
 # Sankey
 # ---------------------------------------------------------------------------
 
-def _resolve_group(df_sub: pd.DataFrame, group_col: str) -> pd.Series:
-    """Returns the grouping series, falling back to descricao when categoria is empty."""
-    if group_col == "categoria":
-        cat = df_sub["categoria"].replace("", pd.NA)
-        return cat.fillna(df_sub["descricao"]).fillna("Sem categoria")
-    return df_sub[group_col].fillna("Sem categoria").replace("", "Sem categoria")
+# Styles per flow tipo: aggregate node label, node colors (aggregate, leaf)
+# and link colors (into the aggregate, into each leaf).
+_SANKEY_AGGREGATES = {
+    "gasto": ("Gastos", "#c0392b", "#e74c3c", "rgba(192,57,43,0.35)", "rgba(231,76,60,0.35)"),
+    "investimento": ("Investimentos", "#6c3483", "#9b59b6", "rgba(108,52,131,0.35)", "rgba(155,89,182,0.35)"),
+}
 
+_figure_cache = cache.LRUCache(max_entries=FIGURE_CACHE_ENTRIES)
 
-def build_sankey(df: pd.DataFrame, group_col: str) -> go.Figure | None:
-    df_receitas = df[df["tipo"].str.lower() == "receita"].copy()
-    df_gastos = df[df["tipo"].str.lower() == "gasto"].copy()
-    df_invest = df[df["tipo"].str.lower() == "investimento"].copy()
 
-    if df_receitas.empty:
+def _sankey_figure(flows: pd.DataFrame) -> go.Figure | None:
+    """Builds the figure from (tipo, grupo, valor) rows, leaves in display order."""
+    is_income = (flows["tipo"] == "receita").to_numpy()
+    if not is_income.any():
         return None
 
-    df_receitas["_group"] = _resolve_group(df_receitas, group_col)
-    income_groups = df_receitas.groupby("_group")["valor"].sum().sort_values(ascending=False)
-    total_receitas = income_groups.sum()
-
-    if not df_gastos.empty:
-        df_gastos["_group"] = _resolve_group(df_gastos, group_col)
-        expense_groups = df_gastos.groupby("_group")["valor"].sum().sort_values(ascending=False)
-    else:
-        expense_groups = pd.Series(dtype=float)
-
-    if not df_invest.empty:
-        df_invest["_group"] = _resolve_group(df_invest, group_col)
-        invest_groups = df_invest.groupby("_group")["valor"].sum().sort_values(ascending=False)
-    else:
-        invest_groups = pd.Series(dtype=float)
-
-    total_gastos = expense_groups.sum()
-    total_invest = invest_groups.sum()
-    saldo_final = total_receitas - total_gastos - total_invest
-
-    # --- Nodes ---
-    labels, colors = [], []
-
-    # Level 1 — income sources
-    income_idx = {}
-    for name in income_groups.index:
-        income_idx[name] = len(labels)
-        labels.append(str(name))
-        colors.append("#2ecc71")
-
-    # Level 2 — budget aggregate
-    budget_idx = len(labels)
-    labels.append("Orçamento Total")
-    colors.append("#3498db")
-
-    # Level 2 → 3 — gastos aggregate (only if there are expenses)
-    gastos_agg_idx = None
-    if total_gastos > 0:
-        gastos_agg_idx = len(labels)
-        labels.append("Gastos")
-        colors.append("#c0392b")
-
-    # Level 3 — expense breakdown
-    expense_idx = {}
-    for name in expense_groups.index:
-        expense_idx[name] = len(labels)
-        labels.append(str(name))
-        colors.append("#e74c3c")
-
-    # Level 2 → 3 — investimentos aggregate (only if there are investments)
-    invest_agg_idx = None
-    if total_invest > 0:
-        invest_agg_idx = len(labels)
-        labels.append("Investimentos")
-        colors.append("#6c3483")
-
-    # Level 3 — investment breakdown
-    invest_idx = {}
-    for name in invest_groups.index:
-        invest_idx[name] = len(labels)
-        labels.append(str(name))
-        colors.append("#9b59b6")
-
-    # Level 2 — saldo final
-    saldo_idx = len(labels)
-    labels.append("Saldo Final")
-    colors.append("#27ae60" if saldo_final >= 0 else "#c0392b")
-
-    # --- Links ---
-    src, tgt, vals, link_colors, hover_vals = [], [], [], [], []
-
-    # Income sources → Orçamento Total
-    for name, val in income_groups.items():
-        src.append(income_idx[name])
-        tgt.append(budget_idx)
-        vals.append(val)
-        link_colors.append("rgba(46,204,113,0.35)")
-        hover_vals.append(format_currency_br(val))
-
-    # Orçamento Total → Gastos (aggregate)
-    if gastos_agg_idx is not None:
-        src.append(budget_idx)
-        tgt.append(gastos_agg_idx)
-        vals.append(total_gastos)
-        link_colors.append("rgba(192,57,43,0.35)")
-        hover_vals.append(format_currency_br(total_gastos))
-
-    # Gastos (aggregate) → each expense group
-    for name, val in expense_groups.items():
-        src.append(gastos_agg_idx)
-        tgt.append(expense_idx[name])
-        vals.append(val)
-        link_colors.append("rgba(231,76,60,0.35)")
-        hover_vals.append(format_currency_br(val))
-
-    # Orçamento Total → Investimentos (aggregate)
-    if invest_agg_idx is not None:
-        src.append(budget_idx)
-        tgt.append(invest_agg_idx)
-        vals.append(total_invest)
-        link_colors.append("rgba(108,52,131,0.35)")
-        hover_vals.append(format_currency_br(total_invest))
-
-    # Investimentos (aggregate) → each investment group
-    for name, val in invest_groups.items():
-        src.append(invest_agg_idx)
-        tgt.append(invest_idx[name])
-        vals.append(val)
-        link_colors.append("rgba(155,89,182,0.35)")
-        hover_vals.append(format_currency_br(val))
-
-    # Orçamento Total → Saldo Final
+    labels = flows["grupo"].astype(str).to_numpy(dtype=object)
+    values = flows["valor"].to_numpy(dtype=float)
+    totals = flows.groupby("tipo")["valor"].sum()
+    saldo_final = totals["receita"] - totals.get("gasto", 0.0) - totals.get("investimento", 0.0)
+
+    # --- Nodes: income sources, budget, then each aggregate followed by its leaves, saldo ---
+    n_income = int(is_income.sum())
+    budget_idx = n_income
+    node_labels = [labels[is_income], ["Orçamento Total"]]
+    node_colors = [np.full(n_income, "#2ecc71", dtype=object), ["#3498db"]]
+
+    # --- Links: income → budget, budget → aggregate, aggregate → leaves, budget → saldo ---
+    src = [np.arange(n_income)]
+    tgt = [np.full(n_income, budget_idx)]
+    vals = [values[is_income]]
+    link_colors = [np.full(n_income, "rgba(46,204,113,0.35)", dtype=object)]
+
+    next_idx = budget_idx + 1
+    for tipo, (agg_label, agg_color, leaf_color, agg_link, leaf_link) in _SANKEY_AGGREGATES.items():
+        total = totals.get(tipo, 0.0)
+        if total <= 0:
+            continue
+        in_tipo = (flows["tipo"] == tipo).to_numpy()
+        n_leaves = int(in_tipo.sum())
+        agg_idx = next_idx
+        leaf_idx = np.arange(agg_idx + 1, agg_idx + 1 + n_leaves)
+        next_idx = agg_idx + 1 + n_leaves
+
+        node_labels += [[agg_label], labels[in_tipo]]
+        node_colors += [[agg_color], np.full(n_leaves, leaf_color, dtype=object)]
+        src += [[budget_idx], np.full(n_leaves, agg_idx)]
+        tgt += [[agg_idx], leaf_idx]
+        vals += [[total], values[in_tipo]]
+        link_colors += [[agg_link], np.full(n_leaves, leaf_link, dtype=object)]
+
+    saldo_idx = next_idx
+    node_labels.append(["Saldo Final"])
+    node_colors.append(["#27ae60" if saldo_final >= 0 else "#c0392b"])
     if saldo_final > 0:
-        src.append(budget_idx)
-        tgt.append(saldo_idx)
-        vals.append(saldo_final)
-        link_colors.append("rgba(39,174,96,0.35)")
-        hover_vals.append(format_currency_br(saldo_final))
+        src.append([budget_idx])
+        tgt.append([saldo_idx])
+        vals.append([saldo_final])
+        link_colors.append(["rgba(39,174,96,0.35)"])
+
+    labels = np.concatenate(node_labels)
+    colors = np.concatenate(node_colors)
+    src = np.concatenate(src).astype(int)
+    tgt = np.concatenate(tgt).astype(int)
+    vals = np.concatenate(vals).astype(float)
+    link_colors = np.concatenate(link_colors)
+    hover_vals = format_currency_br_series(vals).to_numpy(dtype=object)
 
     fig = go.Figure(go.Sankey(
         arrangement="snap",
@@ -187,35 +129,91 @@ def build_sankey(df: pd.DataFrame, group_col: str) -> go.Figure | None:
     return fig
 
 
+def _cached_aggregates(
+    username: str, df: pd.DataFrame, period: tuple[date | None, date | None]
+) -> aggregates.DashboardAggregates:
+    """DashboardAggregates of the period, memoized by (user, data version, period)."""
+    key = ("agregados", username, db_utils.data_version(username), period)
+    return _figure_cache.get_or_load(key, lambda: aggregates.DashboardAggregates(df))
+
+
+def _cached_sankey(
+    username: str,
+    aggs: aggregates.DashboardAggregates,
+    period: tuple[date | None, date | None],
+    group_col: str,
+    top_n: int | None,
+) -> tuple[go.Figure | None, pd.DataFrame]:
+    """
+    Sankey figure and the groups folded into "Outros", memoized by
+    (user, data version, period, group_col, top_n).
+    """
+    def load():
+        flows, folded = aggregates.fold_top_n(
+            aggs.sankey_flows(group_col), "grupo", top_n, by=["tipo"]
+        )
+        return _sankey_figure(flows), folded
+
+    key = ("sankey", username, db_utils.data_version(username), period, group_col, top_n)
+    return _figure_cache.get_or_load(key, load)
+
+
+def _others_drilldown(folded: pd.DataFrame, what: str) -> None:
+    """Expander listing the groups a chart folded into "Outros"."""
+    if folded.empty:
+        return
+    with st.expander(f"🔎 Detalhar \"{CHART_OTHERS_LABEL}\" ({len(folded)} {what})"):
+        st.dataframe(
+            folded.assign(valor=format_currency_br_series(folded["valor"])),
+            use_container_width=True,
+            hide_index=True,
+        )
+
+
 # ---------------------------------------------------------------------------
 # Edit / Delete helper
 # ---------------------------------------------------------------------------
 
-def _edit_delete_section(username: str, df: pd.DataFrame):
-    """Expander with edit and delete controls for an existing transaction."""
+@st.fragment
+def _edit_delete_section(username: str, period: tuple[date | None, date | None]):
+    """
+    Expander with edit and delete controls for an existing transaction. The
+    selector lists at most EDIT_SEARCH_LIMIT matches of a SQL search, not the
+    whole period.
+    """
     with st.expander("✏️ Editar ou Excluir Transação"):
-        if df.empty:
-            st.info("Nenhuma transação disponível.")
+        query = st.text_input(
+            "Buscar transação",
+            key="manage_tx_search",
+            placeholder="id (#123), trecho da descrição ou valor (45,90)",
+        )
+        matches = db_utils.search_transactions(username, query, *period)
+        if matches.empty:
+            st.info("Nenhuma transação encontrada." if query else "Nenhuma transação disponível.")
             return
-
-        def fmt_tx(tx_id):
-            row = df[df["id"] == tx_id].iloc[0]
-            tipo_str = str(row["tipo"]).upper()
-            desc = str(row["descricao"])[:35]
-            val = format_currency_br(row["valor"])
-            return f"#{tx_id} | {tipo_str} | {val} | {desc}"
+        if len(matches) == EDIT_SEARCH_LIMIT:
+            st.caption(f"Mostrando as {EDIT_SEARCH_LIMIT} mais recentes — refine a busca para ver outras.")
+
+        # id-indexed view: option labels and the selected row are O(1) lookups.
+        by_id = matches.set_index("id", drop=False)
+        labels = (
+            "#" + by_id["id"].astype(str)
+            + " | " + by_id["tipo"].astype(str).str.upper()
+            + " | " + format_currency_br_series(by_id["valor"])
+            + " | " + by_id["descricao"].astype(str).str.slice(0, 35)
+        ).to_dict()
 
         selected_id = st.selectbox(
             "Selecione a transação",
-            df["id"].tolist(),
-            format_func=fmt_tx,
+            list(labels),
+            format_func=labels.get,
             key="manage_tx_id",
         )
 
         if selected_id is None:
             return
 
-        row = df[df["id"] == selected_id].iloc[0]
+        row = by_id.loc[selected_id]
 
         tab_edit, tab_del = st.tabs(["✏️ Editar", "🗑️ Excluir"])
 
@@ -266,7 +264,7 @@ def _edit_delete_section(username: str, df: pd.DataFrame):
                 edit_banco = st.text_input("Banco/Instituição", value=str(row["banco"]))
                 edit_desc = st.text_area("Descrição", value=str(row["descricao"]))
 
-                current_dt = row["data_hora_dt"] if "data_hora_dt" in df.columns else datetime.now()
+                current_dt = row["data_hora_dt"] if "data_hora_dt" in by_id.columns else datetime.now()
                 if not isinstance(current_dt, datetime):
                     current_dt = datetime.now()
                 edit_date = st.date_input("Data", current_dt.date(), key=f"edit_date_{selected_id}")
@@ -294,8 +292,49 @@ def _edit_delete_section(username: str, df: pd.DataFrame):
 # Dashboard page
 # ---------------------------------------------------------------------------
 
-def _period_filter(df: pd.DataFrame) -> pd.DataFrame:
-    """Renders the period selector in the sidebar and returns the filtered DataFrame."""
+def _month_end(day: date) -> date:
+    next_month = day.replace(day=28) + timedelta(days=4)
+    return next_month - timedelta(days=next_month.day)
+
+
+def _is_month_aligned(start: date | None, end: date | None, latest: date | None) -> bool:
+    """
+    True when the period covers whole calendar months (or the whole history).
+    A period ending mid-month still counts when no transaction (`latest` is
+    the newest one) falls after its end, e.g. "Este mês" with nothing
+    scheduled later in the month.
+    """
+    if start is None and end is None:
+        return True
+    if start is None or end is None:
+        return False
+    return start.day == 1 and (end == _month_end(end) or latest is None or latest <= end)
+
+
+def _summary_metrics(
+    username: str, aggs: aggregates.DashboardAggregates, start: date | None, end: date | None
+) -> tuple[dict[str, float], pd.DataFrame]:
+    """
+    Totals per tipo and expenses per bank. Month-aligned periods are answered
+    from the monthly rollup table; other periods use the shared aggregates.
+    """
+    history = db_utils.get_synced_transactions(username)
+    newest = history["data_hora_dt"].max() if not history.empty else pd.NaT
+    latest = None if pd.isna(newest) else newest.date()
+    if not _is_month_aligned(start, end, latest):
+        return aggs.totals, aggs.gastos_por_banco
+
+    rollup = db_utils.get_monthly_rollup(username, start, end)
+    totals = rollup.groupby("tipo")["total"].sum()
+    by_bank = rollup[rollup["tipo"] == "gasto"].groupby("banco")["total"].sum()
+    gastos_por_banco = (
+        by_bank.sort_values(ascending=False).rename("valor").rename_axis("banco").reset_index()
+    )
+    return totals.to_dict(), gastos_por_banco
+
+
+def _period_selector() -> tuple[date | None, date | None]:
+    """Renders the period selector in the sidebar and returns the (start, end) dates, inclusive."""
     today = datetime.now().date()
 
     PERIOD_OPTIONS = {
@@ -318,200 +357,281 @@ def _period_filter(df: pd.DataFrame) -> pd.DataFrame:
     period = PERIOD_OPTIONS[selected_label]
 
     if period == "month":
-        start = today.replace(day=1)
-        end = today
-    elif period == "quarter":
-        start = today - timedelta(days=89)
-        end = today
-    elif period == "year":
-        start = today.replace(month=1, day=1)
-        end = today
-    elif period == "all":
-        return df
-    else:  # custom
-        col_a, col_b = st.sidebar.columns(2)
-        with col_a:
-            start = st.sidebar.date_input("De", today.replace(day=1), key="period_start")
-        with col_b:
-            end = st.sidebar.date_input("Até", today, key="period_end")
-
-    if "data_hora_dt" not in df.columns:
-        return df
-
-    mask = (df["data_hora_dt"].dt.date >= start) & (df["data_hora_dt"].dt.date <= end)
-    filtered = df[mask]
-    total = len(df)
-    shown = len(filtered)
-    st.sidebar.caption(f"{shown} de {total} transações no período.")
-    return filtered
-
-
-def dashboard_page(username):
-    st.title(f"{DASHBOARD_ICON} Planilha Financeira de {username}")
-
-    df_transacoes = db_utils.get_transactions_for_user(username)
-
-    if not df_transacoes.empty:
-        df_transacoes["valor"] = pd.to_numeric(df_transacoes["valor"], errors="coerce")
-        df_transacoes.dropna(subset=["valor"], inplace=True)
+        return today.replace(day=1), today
+    if period == "quarter":
+        return today - timedelta(days=89), today
+    if period == "year":
+        return today.replace(month=1, day=1), today
+    if period == "all":
+        return None, None
+
+    col_a, col_b = st.sidebar.columns(2)
+    with col_a:
+        start = st.sidebar.date_input("De", today.replace(day=1), key="period_start")
+    with col_b:
+        end = st.sidebar.date_input("Até", today, key="period_end")
+    return start, end
+
+
+def _period_bounds(df: pd.DataFrame, start: date | None, end: date | None) -> tuple[int, int]:
+    """
+    Positional bounds [lo, hi) of the rows between start and end (inclusive,
+    whole days) in the synced history, which is sorted newest first. Two
+    binary searches over a reversed (ascending) view of data_hora_dt.
+    """
+    dates = df["data_hora_dt"].to_numpy()[::-1]
+    n = len(dates)
+    first = 0 if start is None else int(np.searchsorted(dates, pd.Timestamp(start).to_datetime64()))
+    past = n if end is None else int(
+        np.searchsorted(dates, pd.Timestamp(end + timedelta(days=1)).to_datetime64())
+    )
+    return n - past, n - first
 
-        if "data_hora_dt" not in df_transacoes.columns and "data_hora" in df_transacoes.columns:
-            df_transacoes["data_hora_dt"] = pd.to_datetime(df_transacoes["data_hora"])
 
-        df_transacoes = _period_filter(df_transacoes)
+def _period_filter(df: pd.DataFrame, start: date | None, end: date | None) -> pd.DataFrame:
+    """Rows of the synced history in the period, as a positional slice (no mask, no copy)."""
+    if df.empty:
+        return df
+    lo, hi = _period_bounds(df, start, end)
+    return df.iloc[lo:hi]
+
+
+def _period_transactions(username: str, period: tuple[date | None, date | None]) -> pd.DataFrame:
+    """
+    Transactions of the period: the synced history (a cache hit between writes)
+    sliced by _period_filter. Every dashboard section starts from here, so a
+    fragment rerun never depends on frames computed by another section.
+    """
+    df = _period_filter(db_utils.get_synced_transactions(username), *period)
+    if not df.empty and not pd.api.types.is_numeric_dtype(df["valor"]):
+        df = df.assign(valor=pd.to_numeric(df["valor"], errors="coerce")).dropna(subset=["valor"])
+    return df
+
+
+@st.fragment
+def _transactions_table(username: str, period: tuple[date | None, date | None]) -> None:
+    """
+    One page of the transaction table, read from SQL with a keyset cursor, and
+    the export download. Paging, sorting and the export format rerun only this
+    section; rendering cost depends on the page size, not on the history.
+    """
+    st.subheader("Visão Geral das Suas Transações")
+
+    col_sort, col_order, col_size = st.columns([2, 1, 1])
+    with col_sort:
+        sort = st.selectbox(
+            "Ordenar por", list(TABLE_SORT_LABELS), format_func=TABLE_SORT_LABELS.get, key="tx_sort"
+        )
+    with col_order:
+        descending = st.selectbox(
+            "Ordem", [True, False], format_func=lambda d: "Decrescente" if d else "Crescente", key="tx_order"
+        )
+    with col_size:
+        page_size = st.selectbox(
+            "Linhas por página",
+            TABLE_PAGE_SIZE_OPTIONS,
+            index=TABLE_PAGE_SIZE_OPTIONS.index(TABLE_PAGE_SIZE),
+            key="tx_page_size",
+        )
 
-        if "data_hora_dt" in df_transacoes.columns:
-            df_transacoes = df_transacoes.sort_values(
-                by=["data_hora_dt", "id"], ascending=[False, False]
-            )
-            df_transacoes["data_hora_display"] = df_transacoes["data_hora_dt"].dt.strftime(
-                "%d/%m/%Y %H:%M:%S"
-            )
-        else:
-            df_transacoes["data_hora_display"] = pd.Series(dtype="str")
-
-        # --- Transaction table ---
-        st.subheader("Visão Geral das Suas Transações")
-        df_display = df_transacoes[
-            ["id", "tipo", "valor", "tipo_cartao", "banco", "descricao", "categoria", "data_hora_display"]
-        ].copy()
-        df_display.rename(columns={"data_hora_display": "Data/Hora"}, inplace=True)
-        df_display["tipo"] = df_display["tipo"].str.upper()
-        df_display["valor_formatado"] = df_display["valor"].apply(format_currency_br)
+    # Cursors of the pages visited so far (None = first page). Changing the
+    # period, the order or the page size starts over from the first page.
+    view = (period, sort, descending, page_size)
+    pages = st.session_state.get("tx_pages")
+    if pages is None or pages["view"] != view:
+        pages = st.session_state["tx_pages"] = {"view": view, "cursors": [None]}
+    cursors = pages["cursors"]
 
+    page = db_utils.get_transactions_page(
+        username, *period, sort=sort, descending=descending, after=cursors[-1], page_size=page_size
+    )
+    rows = page.rows
+    if rows.empty:
+        st.info("Nenhuma transação nesta página.")
+    else:
         st.dataframe(
-            df_display[["id", "tipo", "valor_formatado", "tipo_cartao", "banco", "descricao", "categoria", "Data/Hora"]],
+            pd.DataFrame({
+                "id": rows["id"],
+                "tipo": rows["tipo"].str.upper(),
+                "valor_formatado": format_currency_br_series(rows["valor"]),
+                "tipo_cartao": rows["tipo_cartao"],
+                "banco": rows["banco"],
+                "descricao": rows["descricao"],
+                "categoria": rows["categoria"],
+                "Data/Hora": rows["data_hora_dt"].dt.strftime("%d/%m/%Y %H:%M:%S"),
+            }),
             use_container_width=True,
             hide_index=True,
         )
 
-        # CSV export
-        if "data_hora_dt" in df_transacoes.columns:
-            csv_data = df_transacoes[EXPECTED_UPLOAD_COLUMNS[:-1] + ["data_hora_dt"]].copy()
-            csv_data["data_hora"] = csv_data["data_hora_dt"].dt.strftime(UPLOAD_DATETIME_FORMAT)
-            csv_data_final = csv_data[EXPECTED_UPLOAD_COLUMNS]
-        else:
-            available = [c for c in EXPECTED_UPLOAD_COLUMNS if c in df_transacoes.columns]
-            csv_data_final = df_transacoes[available].copy()
-            for col in EXPECTED_UPLOAD_COLUMNS:
-                if col not in csv_data_final.columns:
-                    csv_data_final[col] = pd.NA
-
-        csv_buffer = StringIO()
-        csv_data_final.to_csv(csv_buffer, index=False, sep=",", encoding="utf-8")
-        st.download_button(
-            label="📥 Baixar Transações (CSV)",
-            data=csv_buffer.getvalue(),
-            file_name=f"transacoes_{username}.csv",
-            mime="text/csv",
+    total = db_utils.count_transactions(username, start=period[0], end=period[1])
+    col_prev, col_info, col_next = st.columns([1, 2, 1], vertical_alignment="center")
+    with col_prev:
+        st.button("← Anterior", key="tx_prev", on_click=cursors.pop, disabled=len(cursors) == 1)
+    with col_info:
+        st.caption(f"Página {len(cursors)} de {max(1, math.ceil(total / page_size))} · {total} transações")
+    with col_next:
+        st.button(
+            "Próxima →",
+            key="tx_next",
+            on_click=cursors.append,
+            args=(page.next_cursor,),
+            disabled=page.next_cursor is None,
         )
 
-        # --- Edit / Delete ---
-        _edit_delete_section(username, df_transacoes)
-
-        st.markdown("---")
+    # Export: generated from SQL in chunks only when the download is clicked.
+    col_fmt, col_btn = st.columns([1, 2], vertical_alignment="bottom")
+    with col_fmt:
+        export_fmt = st.selectbox(
+            "Formato",
+            options=list(exporter.EXPORT_FORMATS),
+            format_func=lambda f: exporter.EXPORT_FORMATS[f][0],
+            key="export_format",
+        )
+    label, extension, mime = exporter.EXPORT_FORMATS[export_fmt]
+    with col_btn:
+        st.download_button(
+            label=f"📥 Baixar Transações ({label})",
+            data=lambda: exporter.export_transactions(username, export_fmt, *period),
+            file_name=f"transacoes_{username}.{extension}",
+            mime=mime,
+            on_click="ignore",
+        )
 
-        # --- Metrics ---
-        total_gastos = df_transacoes[df_transacoes["tipo"].str.lower() == "gasto"]["valor"].sum()
-        total_receitas = df_transacoes[df_transacoes["tipo"].str.lower() == "receita"]["valor"].sum()
-        total_invest = df_transacoes[df_transacoes["tipo"].str.lower() == "investimento"]["valor"].sum()
-        saldo_atual = total_receitas - total_gastos - total_invest
-
-        st.subheader("Resumo Financeiro")
-        col1, col2, col3, col4 = st.columns(4)
-        with col1:
-            st.metric("Total de Receitas 📈", format_currency_br(total_receitas))
-        with col2:
-            st.metric("Total de Gastos 📉", format_currency_br(total_gastos), delta_color="inverse")
-        with col3:
-            st.metric("Investimentos 📊", format_currency_br(total_invest))
-        with col4:
-            st.metric("Saldo Disponível 💲", format_currency_br(saldo_atual))
 
-        st.markdown("---")
+def _metrics_section(username: str, period: tuple[date | None, date | None]) -> None:
+    """The four summary metrics."""
+    aggs = _cached_aggregates(username, _period_transactions(username, period), period)
+    totals, _ = _summary_metrics(username, aggs, *period)
+    total_gastos = totals.get("gasto", 0.0)
+    total_receitas = totals.get("receita", 0.0)
+    total_invest = totals.get("investimento", 0.0)
+    saldo_atual = total_receitas - total_gastos - total_invest
 
-        # --- Bar chart: expenses by bank ---
-        st.subheader("Gastos por Banco")
-        gastos_por_banco = (
-            df_transacoes[df_transacoes["tipo"].str.lower() == "gasto"]
-            .groupby("banco")["valor"]
-            .sum()
-            .sort_values(ascending=False)
-            .reset_index()
+    st.subheader("Resumo Financeiro")
+    fmt_receitas, fmt_gastos, fmt_invest, fmt_saldo = format_currency_br_series(
+        [total_receitas, total_gastos, total_invest, saldo_atual]
+    )
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Total de Receitas 📈", fmt_receitas)
+    with col2:
+        st.metric("Total de Gastos 📉", fmt_gastos, delta_color="inverse")
+    with col3:
+        st.metric("Investimentos 📊", fmt_invest)
+    with col4:
+        st.metric("Saldo Disponível 💲", fmt_saldo)
+
+
+def _bank_chart(gastos_por_banco: pd.DataFrame, top_n: int | None) -> None:
+    """Bar chart of expenses per bank."""
+    st.subheader("Gastos por Banco")
+    gastos_por_banco, bancos_agrupados = aggregates.fold_top_n(gastos_por_banco, "banco", top_n)
+    if not gastos_por_banco.empty:
+        fig_bank = px.bar(
+            gastos_por_banco,
+            x="banco",
+            y="valor",
+            color="banco",
+            title="Gastos Totais por Banco",
+            labels={"banco": "Banco", "valor": "Valor (R$)"},
+            text="valor",
         )
-        if not gastos_por_banco.empty:
-            fig_bank = px.bar(
-                gastos_por_banco,
-                x="banco",
-                y="valor",
-                color="banco",
-                title="Gastos Totais por Banco",
-                labels={"banco": "Banco", "valor": "Valor (R$)"},
-                text="valor",
-            )
-            fig_bank.update_traces(texttemplate="R$ %{text:,.2f}", textposition="outside")
-            fig_bank.update_layout(uniformtext_minsize=8, uniformtext_mode="hide")
-            st.plotly_chart(fig_bank, use_container_width=True)
-        else:
-            st.info("Nenhum gasto registrado para exibir por banco.")
-
-        st.markdown("---")
+        fig_bank.update_traces(texttemplate="R$ %{text:,.2f}", textposition="outside")
+        fig_bank.update_layout(uniformtext_minsize=8, uniformtext_mode="hide")
+        st.plotly_chart(fig_bank, use_container_width=True)
+        _others_drilldown(bancos_agrupados, "bancos")
+    else:
+        st.info("Nenhum gasto registrado para exibir por banco.")
+
+
+def _income_pie(receitas_por_descricao: pd.DataFrame, top_n: int | None) -> None:
+    """Pie chart of income sources."""
+    st.subheader("Fontes de Receita por Descrição")
+    if receitas_por_descricao.empty:
+        st.info("Nenhuma receita registrada.")
+        return
+    receitas_por_desc, receitas_agrupadas = aggregates.fold_top_n(receitas_por_descricao, "descricao", top_n)
+    if receitas_por_desc["valor"].sum() > 0:
+        fig_pie = px.pie(
+            receitas_por_desc,
+            names="descricao",
+            values="valor",
+            title="Distribuição Percentual das Fontes de Receita",
+            hole=0.3,
+        )
+        fig_pie.update_traces(textposition="inside", textinfo="percent+label")
+        fig_pie.update_layout(legend_title_text="Fontes", uniformtext_minsize=10, uniformtext_mode="hide")
+        st.plotly_chart(fig_pie, use_container_width=True)
+        _others_drilldown(receitas_agrupadas, "fontes de receita")
+    else:
+        st.info("Nenhuma receita com valor positivo para exibir.")
 
-        # --- Pie chart: income sources ---
-        st.subheader("Fontes de Receita por Descrição")
-        df_receitas_pie = df_transacoes[df_transacoes["tipo"].str.lower() == "receita"].copy()
-        if not df_receitas_pie.empty:
-            receitas_por_desc = (
-                df_receitas_pie.groupby("descricao")["valor"].sum().sort_values(ascending=False).reset_index()
-            )
-            if receitas_por_desc["valor"].sum() > 0:
-                fig_pie = px.pie(
-                    receitas_por_desc,
-                    names="descricao",
-                    values="valor",
-                    title="Distribuição Percentual das Fontes de Receita",
-                    hole=0.3,
-                )
-                fig_pie.update_traces(textposition="inside", textinfo="percent+label")
-                fig_pie.update_layout(legend_title_text="Fontes", uniformtext_minsize=10, uniformtext_mode="hide")
-                st.plotly_chart(fig_pie, use_container_width=True)
-            else:
-                st.info("Nenhuma receita com valor positivo para exibir.")
-        else:
-            st.info("Nenhuma receita registrada.")
 
-        st.markdown("---")
+@st.fragment
+def _sankey_section(username: str, period: tuple[date | None, date | None], top_n: int | None) -> None:
+    """Sankey and its grouping radio. Reruns alone when the grouping changes."""
+    st.subheader("Fluxo Financeiro (Sankey)")
 
-        # --- Sankey ---
-        st.subheader("Fluxo Financeiro (Sankey)")
+    group_col = st.radio(
+        "Agrupar por:",
+        options=SANKEY_GROUP_OPTIONS,
+        format_func=lambda k: SANKEY_GROUP_LABELS[k],
+        horizontal=True,
+        key="sankey_group",
+    )
 
-        group_col = st.radio(
-            "Agrupar por:",
-            options=SANKEY_GROUP_OPTIONS,
-            format_func=lambda k: SANKEY_GROUP_LABELS[k],
-            horizontal=True,
-            key="sankey_group",
+    aggs = _cached_aggregates(username, _period_transactions(username, period), period)
+    fig_sankey, sankey_agrupados = _cached_sankey(username, aggs, period, group_col, top_n)
+    if fig_sankey is None:
+        st.info("Adicione receitas para visualizar o fluxo financeiro.")
+        return
+
+    totals = aggs.totals
+    saldo_atual = totals.get("receita", 0.0) - totals.get("gasto", 0.0) - totals.get("investimento", 0.0)
+    if saldo_atual < 0:
+        st.warning(
+            f"Atenção: saldo negativo ({format_currency_br(saldo_atual)}). "
+            "O nó 'Saldo Final' não aparece no Sankey quando o saldo é negativo.",
+            icon="⚠️",
         )
+    st.plotly_chart(fig_sankey, use_container_width=True)
+    _others_drilldown(sankey_agrupados, "grupos")
+
+
+@st.fragment
+def _charts_section(username: str, period: tuple[date | None, date | None]) -> None:
+    """
+    Level-of-detail slider with the bank, pie and Sankey charts. Moving the
+    slider reruns only these charts; the Sankey radio reruns only the Sankey.
+    """
+    top_n = st.select_slider(
+        "Detalhe dos gráficos",
+        options=CHART_TOP_N_OPTIONS,
+        value=CHART_TOP_N,
+        format_func=lambda n: f"Top {n}" if n else "Todos",
+        key="chart_top_n",
+        help=f"Os grupos além do limite são somados em \"{CHART_OTHERS_LABEL}\".",
+    )
 
-        fig_sankey = build_sankey(df_transacoes, group_col)
-        if fig_sankey is not None:
-            if saldo_atual < 0:
-                st.warning(
-                    f"Atenção: saldo negativo ({format_currency_br(saldo_atual)}). "
-                    "O nó 'Saldo Final' não aparece no Sankey quando o saldo é negativo.",
-                    icon="⚠️",
-                )
-            st.plotly_chart(fig_sankey, use_container_width=True)
-        else:
-            st.info("Adicione receitas para visualizar o fluxo financeiro.")
+    aggs = _cached_aggregates(username, _period_transactions(username, period), period)
+    _, gastos_por_banco = _summary_metrics(username, aggs, *period)
+    _bank_chart(gastos_por_banco, top_n)
 
-    else:
-        st.info("Nenhuma transação registrada ainda. Adicione no formulário ou faça upload!")
+    st.markdown("---")
+    _income_pie(aggs.receitas_por_descricao, top_n)
 
     st.markdown("---")
+    _sankey_section(username, period, top_n)
+
 
-    # --- Bulk CSV upload ---
-    st.subheader("📤 Upload de Transações em Lote (CSV)")
+@st.fragment
+def _upload_section(username: str) -> None:
+    """
+    Bulk CSV / Parquet upload. An import that inserts any row reruns the whole
+    page; its report (inserted count, rejected rows) is shown after the rerun.
+    """
+    st.subheader("📤 Upload de Transações em Lote (CSV ou Parquet)")
 
     try:
         with open(TRANSACTION_TEMPLATE_PATH, "rb") as fp:
@@ -532,31 +652,79 @@ def dashboard_page(username):
         f"ou `{UPLOAD_DATETIME_FORMAT}` (ex: 31/12/2023 15:30:00)."
     )
 
-    uploaded_file = st.file_uploader("Escolha um arquivo CSV", type="csv", key="transaction_uploader")
+    st.caption("Arquivos Parquet exportados acima também podem ser importados, com as mesmas colunas.")
+
+    uploaded_file = st.file_uploader(
+        "Escolha um arquivo CSV ou Parquet", type=["csv", "parquet"], key="transaction_uploader"
+    )
     if uploaded_file is not None:
         try:
-            df_upload = pd.read_csv(uploaded_file)
-            missing_cols = [c for c in EXPECTED_UPLOAD_COLUMNS if c not in df_upload.columns]
+            missing_cols = importer.missing_upload_columns(uploaded_file)
             if missing_cols:
-                st.error(f"Colunas ausentes no CSV: {', '.join(missing_cols)}. Use o modelo.")
+                st.error(f"Colunas ausentes no arquivo: {', '.join(missing_cols)}. Use o modelo.")
             else:
-                df_to_process = df_upload[EXPECTED_UPLOAD_COLUMNS].copy()
                 st.write("Pré-visualização (primeiras 5 linhas):")
-                st.dataframe(df_to_process.head())
-
-                if st.button("Confirmar e Inserir Transações do CSV"):
-                    with st.spinner("Processando transações..."):
-                        success_count, fail_count = db_utils.bulk_insert_transactions(username, df_to_process)
-                    if success_count > 0:
-                        st.success(f"{success_count} transações inseridas com sucesso!")
-                    if fail_count > 0:
-                        st.warning(f"{fail_count} transações falharam. Verifique os avisos acima.")
-                    if success_count > 0:
+                st.dataframe(importer.read_upload_preview(uploaded_file))
+
+                if st.button("Confirmar e Inserir Transações do Arquivo"):
+                    progress = st.progress(0.0, text="Processando transações...")
+                    stream_import = (
+                        importer.stream_import_parquet if importer.is_parquet(uploaded_file)
+                        else importer.stream_import_csv
+                    )
+                    result = stream_import(
+                        username,
+                        uploaded_file,
+                        on_progress=lambda frac: progress.progress(
+                            frac, text=f"Processando transações... {frac:.0%}"
+                        ),
+                    )
+                    progress.empty()
+                    # Any inserted row changes the sections outside this fragment,
+                    # so the report is kept in the session and shown after the rerun.
+                    st.session_state["upload_result"] = result
+                    if result.inserted > 0:
                         st.rerun()
         except pd.errors.EmptyDataError:
-            st.error("O arquivo CSV está vazio.")
+            st.error("O arquivo está vazio.")
         except Exception as e:
-            st.error(f"Erro ao processar o CSV: {e}")
+            st.error(f"Erro ao processar o arquivo: {e}")
+
+    result = st.session_state.pop("upload_result", None)
+    if result is not None:
+        if result.inserted > 0:
+            st.success(f"{result.inserted} transações inseridas com sucesso!")
+        if result.failed > 0:
+            st.warning(f"{result.failed} linhas rejeitadas:")
+            st.dataframe(result.rejected, hide_index=True, use_container_width=True)
+
+
+def dashboard_page(username):
+    st.title(f"{DASHBOARD_ICON} Planilha Financeira de {username}")
+
+    # Each section below reads the period through _period_transactions; the
+    # ones with widgets are fragments, so interacting with them reruns only
+    # that section. Writes call st.rerun(), which reruns the whole page.
+    period = _period_selector()
+    df_historico = db_utils.get_synced_transactions(username)
+    df_transacoes = _period_filter(df_historico, *period)
+    if period[0] is not None:
+        st.sidebar.caption(f"{len(df_transacoes)} de {len(df_historico)} transações no período.")
+
+    if not df_transacoes.empty:
+        _transactions_table(username, period)
+        _edit_delete_section(username, period)
+
+        st.markdown("---")
+        _metrics_section(username, period)
+
+        st.markdown("---")
+        _charts_section(username, period)
+    else:
+        st.info("Nenhuma transação registrada ainda. Adicione no formulário ou faça upload!")
+
+    st.markdown("---")
+    _upload_section(username)
 
     if st.sidebar.button("Formulário de Transação " + FORM_ICON, use_container_width=True, key="dash_to_form_button"):
         st.session_state["page"] = "form"
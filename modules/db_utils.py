@@ -1,50 +1,231 @@
 # modules/db_utils.py
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Iterator
+import numpy as np
 import pandas as pd
 import streamlit as st
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import hashlib
 
-from .config import DB_MASTER_NAME, UPLOAD_DATE_FORMAT, UPLOAD_DATETIME_FORMAT
+from .config import (
+    DB_MASTER_NAME,
+    DB_POOL_SIZE,
+    DB_BUSY_TIMEOUT,
+    DB_PRAGMAS,
+    COMPACT_STORAGE,
+    SHARED_STORAGE,
+    FRAME_CACHE_MAX_BYTES,
+    CATEGORICAL_COLUMNS,
+    UPLOAD_DATE_FORMAT,
+    UPLOAD_DATETIME_FORMAT,
+    EDIT_SEARCH_LIMIT,
+    EXPORT_CHUNK_ROWS,
+    TABLE_PAGE_SIZE,
+)
+from . import cache, schema
 
 
 # ---------------------------------------------------------------------------
 # Conexão
 # ---------------------------------------------------------------------------
 
-def get_db_connection() -> sqlite3.Connection:
-    """Retorna uma conexão com o banco de dados principal."""
-    conn = sqlite3.connect(DB_MASTER_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
+class _ConnectionPool:
+    """
+    Pool limitado de conexões SQLite reaproveitadas entre threads.
+
+    O Streamlit executa cada rerun em uma thread nova, então uma conexão por
+    thread seria descartada a cada interação. O pool mantém até ``size``
+    conexões abertas, já configuradas com ``DB_PRAGMAS``; com o pool esgotado,
+    quem pede uma conexão espera até outra ser devolvida.
+    """
+
+    def __init__(self, database: str, size: int):
+        self._database = database
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._database, timeout=DB_BUSY_TIMEOUT, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma, value in DB_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._open()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+        self._slots.release()
+
+    def close_all(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pool = _ConnectionPool(DB_MASTER_NAME, DB_POOL_SIZE)
+_local = threading.local()
+
+
+@contextmanager
+def db_connection():
+    """
+    Empresta uma conexão do pool durante o bloco ``with``.
+
+    Ao sair faz commit da transação aberta (ou rollback, se o bloco levantar
+    exceção) e devolve a conexão. Blocos aninhados na mesma thread reutilizam
+    a conexão externa e deixam o commit para ela.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        yield conn
+        return
+
+    conn = _pool.acquire()
+    _local.conn = conn
+    try:
+        _check_schema_cookie(conn)
+        yield conn
+        if conn.in_transaction:
+            conn.commit()
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        _local.conn = None
+        _pool.release(conn)
+
+
+_schema_cookie: int | None = None
+
+
+def _check_schema_cookie(conn: sqlite3.Connection) -> None:
+    """
+    Confere os formatos de tabela memorizados quando o schema do banco muda
+    (ex.: uma tabela compactada por outro processo enquanto o app roda).
+    """
+    global _schema_cookie
+    cookie = conn.execute("PRAGMA schema_version").fetchone()[0]
+    if cookie != _schema_cookie:
+        if _schema_cookie is not None:
+            _refresh_user_layouts(conn)
+        _schema_cookie = cookie
+
+
+def _refresh_user_layouts(conn: sqlite3.Connection) -> None:
+    """
+    Redetecta o formato da tabela de cada usuário em memória e esquece apenas
+    os que mudaram, junto com as leituras em cache deles. Qualquer DDL muda o
+    schema_version (um cadastro novo cria tabelas), então os demais usuários
+    mantêm formato, migrações e cache.
+    """
+    cursor = conn.cursor()
+    for username, layout in list(_user_layouts.items()):
+        row = cursor.execute(
+            "SELECT tabela_financeira FROM usuarios_financas WHERE usuario = ?", (username,)
+        ).fetchone()
+        if row and row['tabela_financeira'] == layout.table:
+            if replace(schema.detect_layout(cursor, layout.table), user_id=layout.user_id) == layout:
+                continue
+        _user_layouts.pop(username, None)
+        if not schema.table_columns(cursor, layout.table):
+            _migrated_tables.discard(layout.table)
+        _read_cache.discard_where(lambda key, user=username: key[0] == user)
+
+
+def close_db_connections() -> None:
+    """Fecha as conexões ociosas do pool (ex.: antes de substituir o arquivo do banco)."""
+    _pool.close_all()
 
 
 # ---------------------------------------------------------------------------
 # Inicialização de tabelas
 # ---------------------------------------------------------------------------
 
+# Verdadeiro depois que as tabelas mestras foram conferidas neste processo:
+# o app chama create_initial_tables a cada rerun, e só a primeira chamada
+# consulta o catálogo.
+_master_tables_ready = False
+
+
+def _master_tables_current(cursor: sqlite3.Cursor) -> bool:
+    """True se as tabelas mestras já estão no formato atual (só leituras, sem lock de escrita)."""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index')")
+    names = {row[0] for row in cursor.fetchall()}
+    if not {'users_auth', 'usuarios_financas', 'schema_versions', 'idx_usuarios_financas_user_id'} <= names:
+        return False
+    if 'user_id' not in schema.table_columns(cursor, 'usuarios_financas'):
+        return False
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM usuarios_financas WHERE user_id IS NULL)")
+    return not cursor.fetchone()[0]
+
+
 def create_initial_tables() -> None:
-    """Cria as tabelas mestras se não existirem."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    """
+    Cria (ou atualiza) as tabelas mestras se necessário. Roda a cada rerun do
+    app: quando nada falta, não abre transação de escrita.
+    """
+    global _master_tables_ready
+    if _master_tables_ready:
+        return
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users_auth (
-            username      TEXT PRIMARY KEY,
-            password_hash TEXT NOT NULL
-        )
-    """)
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        if _master_tables_current(cursor):
+            _master_tables_ready = True
+            return
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS usuarios_financas (
-            usuario           TEXT PRIMARY KEY,
-            tabela_financeira TEXT NOT NULL,
-            FOREIGN KEY (usuario) REFERENCES users_auth(username)
-        )
-    """)
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS users_auth (
+                username      TEXT PRIMARY KEY,
+                password_hash TEXT NOT NULL
+            )
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS usuarios_financas (
+                usuario           TEXT PRIMARY KEY,
+                tabela_financeira TEXT NOT NULL,
+                user_id           INTEGER,
+                FOREIGN KEY (usuario) REFERENCES users_auth(username)
+            )
+        """)
 
-    conn.commit()
-    conn.close()
+        # user_id identifica o usuário na tabela compartilhada; bancos antigos
+        # ganham a coluna preenchida com o rowid (estável daqui em diante).
+        if 'user_id' not in schema.table_columns(cursor, 'usuarios_financas'):
+            cursor.execute("ALTER TABLE usuarios_financas ADD COLUMN user_id INTEGER")
+        cursor.execute("UPDATE usuarios_financas SET user_id = rowid WHERE user_id IS NULL")
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_usuarios_financas_user_id
+            ON usuarios_financas (user_id)
+        """)
+
+        schema.create_registry(cursor)
+
+    _master_tables_ready = True
 
 
 # ---------------------------------------------------------------------------
@@ -56,27 +237,22 @@ def hash_password(password: str) -> str:
 
 
 def add_user(username: str, password: str) -> bool:
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            "INSERT INTO users_auth (username, password_hash) VALUES (?, ?)",
-            (username, hash_password(password))
-        )
-        conn.commit()
+        with db_connection() as conn:
+            conn.execute(
+                "INSERT INTO users_auth (username, password_hash) VALUES (?, ?)",
+                (username, hash_password(password))
+            )
         return True
     except sqlite3.IntegrityError:
         return False
-    finally:
-        conn.close()
 
 
 def verify_user(username: str, password: str) -> bool:
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT password_hash FROM users_auth WHERE username = ?", (username,))
-    result = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        result = conn.execute(
+            "SELECT password_hash FROM users_auth WHERE username = ?", (username,)
+        ).fetchone()
     return bool(result and result['password_hash'] == hash_password(password))
 
 
@@ -84,236 +260,941 @@ def verify_user(username: str, password: str) -> bool:
 # Tabela financeira por usuário
 # ---------------------------------------------------------------------------
 
+# Cache do processo: usuário → formato da tabela e tabelas já migradas nesta
+# execução. Depois da primeira resolução, as rotas de CRUD não tocam mais no catálogo.
+_user_layouts: dict[str, schema.TableLayout] = {}
+_migrated_tables: set[str] = set()
+
+
+@contextmanager
+def _user_connection(username: str):
+    """
+    Conexão do pool junto com o formato da tabela do usuário (None se não
+    puder ser resolvido). O formato é resolvido depois do checkout, então
+    reflete mudanças de schema feitas por outros processos.
+    """
+    with db_connection() as conn:
+        yield conn, _get_user_layout(username)
+
+
+def _migrate_table_schema(conn: sqlite3.Connection, table_name: str) -> None:
+    """Aplica as migrações pendentes numa transação de escrita; o commit fica com o chamador."""
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    schema.migrate_table(conn.cursor(), table_name)
+    if COMPACT_STORAGE:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT 1 FROM {table_name} LIMIT 1")
+        if cursor.fetchone() is None:
+            schema.convert_to_compact(cursor, table_name)
+
+
+def list_finance_users() -> list[str]:
+    """Usuários com tabela financeira registrada."""
+    with db_connection() as conn:
+        rows = conn.execute("SELECT usuario FROM usuarios_financas ORDER BY usuario").fetchall()
+    return [row['usuario'] for row in rows]
+
+
+def reset_schema_cache() -> None:
+    """Esquece os formatos de tabela e migrações memorizados (ex.: após manutenção manual no banco)."""
+    _user_layouts.clear()
+    _migrated_tables.clear()
+    _read_cache.clear()
+
+
+def _get_user_layout(username: str) -> schema.TableLayout | None:
+    """
+    Retorna o formato da tabela financeira do usuário, criando-a se necessário.
+
+    Na primeira chamada do processo para cada usuário, registra a tabela em
+    `usuarios_financas` e aplica as migrações pendentes (ver modules/schema.py);
+    as chamadas seguintes respondem do cache em memória, sem consultar o banco.
+    """
+    layout = _user_layouts.get(username)
+    if layout is not None:
+        return layout
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute(
+            "SELECT tabela_financeira, user_id FROM usuarios_financas WHERE usuario = ?",
+            (username,)
+        )
+        result = cursor.fetchone()
+
+        if result:
+            table_name, user_id = result['tabela_financeira'], result['user_id']
+        else:
+            if SHARED_STORAGE:
+                table_name = schema.SHARED_TABLE
+            else:
+                table_name = f"financas_{username.lower().replace(' ', '_')}"
+            try:
+                cursor.execute("""
+                    INSERT INTO usuarios_financas (usuario, tabela_financeira, user_id)
+                    VALUES (?, ?, (SELECT COALESCE(MAX(user_id), 0) + 1 FROM usuarios_financas))
+                    RETURNING user_id
+                """, (username, table_name))
+                user_id = cursor.fetchone()['user_id']
+            except Exception as e:
+                st.error(f"Erro ao registrar tabela para {username}: {e}")
+                return None
+
+        if table_name not in _migrated_tables:
+            _migrate_table_schema(conn, table_name)
+        layout = schema.detect_layout(cursor, table_name)
+        if layout.shared:
+            layout = replace(layout, user_id=user_id)
+
+    _migrated_tables.add(table_name)
+    _user_layouts[username] = layout
+    return layout
+
+
 def get_or_create_user_finance_table_name(username: str) -> str | None:
+    """Retorna o nome da tabela financeira do usuário, criando-a se necessário."""
+    layout = _get_user_layout(username)
+    return layout.table if layout else None
+
+
+def compact_user_table(username: str) -> int:
     """
-    Retorna o nome da tabela financeira do usuário, criando-a se necessário.
-    Também executa a migração para adicionar a coluna 'categoria' caso ela
-    ainda não exista (compatibilidade com dados anteriores).
+    Converte a tabela do usuário para o formato compacto (valor_cents, ts).
+    Retorna o número de linhas convertidas (0 se a tabela já era compacta).
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with _user_connection(username) as (conn, layout):
+        if layout is None or layout.compact:
+            return 0
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        converted = schema.convert_to_compact(conn.cursor(), layout.table)
+    _user_layouts.pop(username, None)
+    if converted:
+        _bump_data_version(username)
+    return converted
 
-    cursor.execute(
-        "SELECT tabela_financeira FROM usuarios_financas WHERE usuario = ?",
-        (username,)
-    )
-    result = cursor.fetchone()
 
-    if result:
-        table_name = result['tabela_financeira']
-    else:
-        table_name = f"financas_{username.lower().replace(' ', '_')}"
-        try:
-            cursor.execute(
-                "INSERT INTO usuarios_financas (usuario, tabela_financeira) VALUES (?, ?)",
-                (username, table_name)
-            )
-        except Exception as e:
-            st.error(f"Erro ao registrar tabela para {username}: {e}")
-            conn.close()
+def move_user_to_shared_table(username: str) -> int | None:
+    """
+    Move as transações da tabela própria do usuário para a tabela compartilhada
+    e apaga a tabela antiga, numa única transação de escrita. Retorna o número
+    de linhas movidas, ou None se o usuário já usa a tabela compartilhada.
+    Os ids das transações mudam.
+    """
+    with _user_connection(username) as (conn, layout):
+        if layout is None or layout.shared:
             return None
-
-    # Cria tabela principal (inclui 'categoria' desde o início)
-    cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS {table_name} (
-            id          INTEGER PRIMARY KEY AUTOINCREMENT,
-            tipo        TEXT    NOT NULL,
-            valor       REAL    NOT NULL,
-            tipo_cartao TEXT,
-            banco       TEXT,
-            descricao   TEXT,
-            categoria   TEXT,
-            data_hora   TEXT    NOT NULL
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.cursor()
+        if schema.SHARED_TABLE not in _migrated_tables:
+            _migrate_table_schema(conn, schema.SHARED_TABLE)
+        user_id = cursor.execute(
+            "SELECT user_id FROM usuarios_financas WHERE usuario = ?", (username,)
+        ).fetchone()['user_id']
+        moved = schema.move_to_shared(cursor, layout.table, user_id)
+        cursor.execute(
+            "UPDATE usuarios_financas SET tabela_financeira = ? WHERE usuario = ?",
+            (schema.SHARED_TABLE, username)
         )
-    """)
+    _migrated_tables.discard(layout.table)
+    _migrated_tables.add(schema.SHARED_TABLE)
+    _user_layouts.pop(username, None)
+    _bump_data_version(username)
+    return moved
+
+
+# ---------------------------------------------------------------------------
+# Cache de leituras
+# ---------------------------------------------------------------------------
+#
+# Transações, contagens, totais e resumo mensal ficam num LRU do processo com
+# chave (usuário, versão dos dados, consulta). Toda escrita feita por este
+# módulo incrementa a versão do usuário, então reruns sem mudança nos dados
+# não tocam no SQLite. Escritas de outros processos só são vistas depois de
+# uma escrita local ou de uma mudança no formato da tabela do usuário (que
+# descarta as entradas dele).
+
+_read_cache = cache.LRUCache(FRAME_CACHE_MAX_BYTES)
+_data_versions: dict[str, int] = {}
+_versions_lock = threading.Lock()
 
-    # Migração: adiciona 'categoria' em tabelas antigas que não possuem a coluna
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    existing_columns = {row['name'] for row in cursor.fetchall()}
-    if 'categoria' not in existing_columns:
-        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN categoria TEXT")
+# Chave (usuário, _HISTORY_KEY) do histórico sincronizado: ao contrário das
+# demais entradas, sobrevive às escritas e é atualizado pelo log de alterações.
+_HISTORY_KEY = "historico"
 
-    conn.commit()
-    conn.close()
-    return table_name
+
+def data_version(username: str) -> int:
+    """Versão dos dados do usuário neste processo; muda a cada escrita."""
+    return _data_versions.get(username, 0)
+
+
+def _bump_data_version(username: str) -> None:
+    with _versions_lock:
+        _data_versions[username] = _data_versions.get(username, 0) + 1
+    _read_cache.discard_where(lambda key: key[0] == username and key[1] != _HISTORY_KEY)
+
+
+def _cached_read(username: str, query: tuple, loader: Callable[[], Any]) -> Any:
+    """
+    Resultado de `loader` para a consulta na versão atual dos dados do usuário.
+    DataFrames voltam como cópia rasa, para que o chamador possa incluir ou
+    trocar colunas sem alterar a entrada do cache.
+    """
+    value = _read_cache.get_or_load((username, data_version(username), *query), loader)
+    if isinstance(value, pd.DataFrame):
+        return value.copy(deep=False)
+    return value
+
+
+def read_cache_stats() -> cache.CacheStats:
+    """Acertos, falhas e ocupação do cache de leituras."""
+    return _read_cache.stats()
+
+
+def read_cache_report() -> pd.DataFrame:
+    """
+    Uma linha por entrada do cache de leituras, da mais para a menos usada:
+    usuario, consulta, linhas e bytes (estimativa de `cache.estimate_size`).
+    Entradas que não são DataFrames ficam com linhas vazio.
+    """
+    rows = []
+    for key, value, size in reversed(_read_cache.entries()):
+        frame = value.frame if isinstance(value, _SyncedFrame) else value
+        rows.append({
+            "usuario": key[0],
+            "consulta": _HISTORY_KEY if key[1] == _HISTORY_KEY else key[2],
+            "linhas": len(frame) if isinstance(frame, pd.DataFrame) else None,
+            "bytes": size,
+        })
+    return pd.DataFrame(rows, columns=["usuario", "consulta", "linhas", "bytes"])
 
 
 # ---------------------------------------------------------------------------
 # CRUD de transações
 # ---------------------------------------------------------------------------
 
+def _encode_transaction(layout: schema.TableLayout, data: dict) -> tuple:
+    """Valores de `layout.columns` para uma transação vinda dos formulários ou do agente."""
+    dt_obj: datetime = data['data_hora']
+    return (
+        data['tipo'].lower(),
+        layout.encode_amount(data['valor']),
+        data['tipo_cartao'].lower().replace(' ', '_').replace('/', '_'),
+        data['banco'].strip(),
+        data['descricao'].strip(),
+        data.get('categoria', '').strip(),
+        layout.encode_datetime(dt_obj),
+    )
+
+
 def insert_transaction(username: str, transaction_data: dict) -> bool:
     """Insere uma única transação."""
-    table_name = get_or_create_user_finance_table_name(username)
-    if not table_name:
-        return False
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        dt_obj: datetime = transaction_data['data_hora']
-        cursor.execute(f"""
-            INSERT INTO {table_name}
-                (tipo, valor, tipo_cartao, banco, descricao, categoria, data_hora)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            transaction_data['tipo'].lower(),
-            float(transaction_data['valor']),
-            transaction_data['tipo_cartao'].lower().replace(' ', '_').replace('/', '_'),
-            transaction_data['banco'].strip(),
-            transaction_data['descricao'].strip(),
-            transaction_data.get('categoria', '').strip(),
-            dt_obj.strftime('%Y-%m-%d %H:%M:%S'),
-        ))
-        conn.commit()
+        with _user_connection(username) as (conn, layout):
+            if not layout:
+                return False
+            conn.execute(f"""
+                INSERT INTO {layout.table} ({', '.join(layout.insert_columns)})
+                VALUES ({', '.join('?' * len(layout.insert_columns))})
+            """, (*layout.owner_values, *_encode_transaction(layout, transaction_data)))
+        _bump_data_version(username)
         return True
     except Exception as e:
         st.error(f"Erro ao inserir transação: {e}")
-        conn.rollback()
         return False
-    finally:
-        conn.close()
 
 
 def update_transaction(username: str, transaction_id: int, updated_data: dict) -> bool:
     """Atualiza uma transação existente pelo id."""
-    table_name = get_or_create_user_finance_table_name(username)
-    if not table_name:
-        return False
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        dt_obj: datetime = updated_data['data_hora']
-        cursor.execute(f"""
-            UPDATE {table_name}
-            SET tipo        = ?,
-                valor       = ?,
-                tipo_cartao = ?,
-                banco       = ?,
-                descricao   = ?,
-                categoria   = ?,
-                data_hora   = ?
-            WHERE id = ?
-        """, (
-            updated_data['tipo'].lower(),
-            float(updated_data['valor']),
-            updated_data['tipo_cartao'].lower().replace(' ', '_').replace('/', '_'),
-            updated_data['banco'].strip(),
-            updated_data['descricao'].strip(),
-            updated_data.get('categoria', '').strip(),
-            dt_obj.strftime('%Y-%m-%d %H:%M:%S'),
-            transaction_id,
-        ))
-        conn.commit()
+        with _user_connection(username) as (conn, layout):
+            if not layout:
+                return False
+            scope, scope_params = layout.scope()
+            cursor = conn.execute(f"""
+                UPDATE {layout.table}
+                SET {', '.join(f'{col} = ?' for col in layout.columns)}
+                WHERE {' AND '.join(['id = ?', *scope])}
+            """, (*_encode_transaction(layout, updated_data), transaction_id, *scope_params))
+        _bump_data_version(username)
         return cursor.rowcount > 0
     except Exception as e:
         st.error(f"Erro ao atualizar transação id={transaction_id}: {e}")
-        conn.rollback()
         return False
-    finally:
-        conn.close()
 
 
 def delete_transaction(username: str, transaction_id: int) -> bool:
     """Remove uma transação pelo id."""
-    table_name = get_or_create_user_finance_table_name(username)
-    if not table_name:
-        return False
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute(f"DELETE FROM {table_name} WHERE id = ?", (transaction_id,))
-        conn.commit()
+        with _user_connection(username) as (conn, layout):
+            if not layout:
+                return False
+            scope, scope_params = layout.scope()
+            cursor = conn.execute(
+                f"DELETE FROM {layout.table} WHERE {' AND '.join(['id = ?', *scope])}",
+                (transaction_id, *scope_params)
+            )
+        _bump_data_version(username)
         return cursor.rowcount > 0
     except Exception as e:
         st.error(f"Erro ao deletar transação id={transaction_id}: {e}")
-        conn.rollback()
         return False
-    finally:
-        conn.close()
 
 
-def get_transactions_for_user(username: str) -> pd.DataFrame:
-    """Retorna todas as transações do usuário ordenadas por data."""
-    table_name = get_or_create_user_finance_table_name(username)
-    if not table_name:
+def _transaction_filters(
+    layout: schema.TableLayout,
+    start: date | datetime | None = None,
+    end: date | datetime | None = None,
+    tipo: str | None = None,
+    categoria: str | None = None,
+    banco: str | None = None,
+) -> tuple[str, list]:
+    """
+    Monta a cláusula WHERE (e seus parâmetros) para os filtros informados.
+    `start` e `end` são inclusivos; um `end` do tipo date cobre o dia inteiro.
+    Na tabela compartilhada inclui sempre o filtro do dono (`user_id`).
+    """
+    clauses, params = layout.scope()
+    date_column = layout.date_column
+    if start is not None:
+        if not isinstance(start, datetime):
+            start = datetime.combine(start, datetime.min.time())
+        clauses.append(f"{date_column} >= ?")
+        params.append(layout.encode_datetime(start))
+    if end is not None:
+        if isinstance(end, datetime):
+            clauses.append(f"{date_column} <= ?")
+            params.append(layout.encode_datetime(end))
+        else:
+            clauses.append(f"{date_column} < ?")
+            params.append(layout.encode_datetime(
+                datetime.combine(end + timedelta(days=1), datetime.min.time())
+            ))
+    if tipo:
+        clauses.append("tipo = ?")
+        params.append(tipo.lower())
+    if categoria:
+        clauses.append("categoria = ? COLLATE NOCASE")
+        params.append(categoria)
+    if banco:
+        clauses.append("banco = ? COLLATE NOCASE")
+        params.append(banco)
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, params
+
+
+def _categorize(df: pd.DataFrame) -> pd.DataFrame:
+    """Converte as CATEGORICAL_COLUMNS presentes em `df` para o dtype category."""
+    present = [col for col in CATEGORICAL_COLUMNS if col in df.columns]
+    return df.astype({col: "category" for col in present})
+
+
+def _decode_frame(layout: schema.TableLayout, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte as colunas gravadas para o formato usado pelas páginas: `valor` em
+    reais, `data_hora_dt` como datetime64 (a única coluna de data) e as colunas
+    de poucos valores distintos como categóricas. No formato compacto não há
+    parsing de texto — `ts` e `valor_cents` já chegam como int64.
+    """
+    if layout.compact:
+        df.insert(2, 'valor', df.pop('valor_cents') / 100)
+        df['data_hora_dt'] = pd.to_datetime(df.pop('ts'), unit='s')
+    else:
+        df['data_hora_dt'] = pd.to_datetime(df.pop('data_hora'))
+    return _categorize(df)
+
+
+def _select_transactions_sql(layout: schema.TableLayout, where: str = "", paging: str = "") -> str:
+    return f"""
+        SELECT id, {', '.join(layout.columns)}
+        FROM {layout.table}
+        {where}
+        ORDER BY {layout.date_column} DESC, id DESC
+        {paging}
+    """
+
+
+def _read_transactions(
+    conn: sqlite3.Connection,
+    layout: schema.TableLayout,
+    where: str = "",
+    params: list | tuple = (),
+    paging: str = "",
+) -> pd.DataFrame:
+    """SELECT das transações, mais recentes primeiro, já convertido por `_decode_frame`."""
+    df = pd.read_sql_query(_select_transactions_sql(layout, where, paging), conn, params=list(params))
+    return _decode_frame(layout, df)
+
+
+def get_transactions_for_user(
+    username: str,
+    start: date | datetime | None = None,
+    end: date | datetime | None = None,
+    tipo: str | None = None,
+    categoria: str | None = None,
+    banco: str | None = None,
+    limit: int | None = None,
+    offset: int | None = None,
+) -> pd.DataFrame:
+    """
+    Retorna as transações do usuário ordenadas por data (mais recentes primeiro).
+    Os filtros opcionais, `limit` e `offset` são aplicados no próprio SQL, e o
+    resultado fica no cache de leituras até a próxima escrita do usuário.
+    """
+    def load() -> pd.DataFrame:
+        with _user_connection(username) as (conn, layout):
+            if not layout:
+                return pd.DataFrame()
+
+            where, params = _transaction_filters(layout, start, end, tipo, categoria, banco)
+            paging = ""
+            if limit is not None or offset is not None:
+                paging = "LIMIT ? OFFSET ?"
+                params += [limit if limit is not None else -1, offset or 0]
+            return _read_transactions(conn, layout, where, params, paging)
+
+    try:
+        query = ("transacoes", start, end, tipo, categoria, banco, limit, offset)
+        return _cached_read(username, query, load)
+    except Exception as e:
+        st.error(f"Erro ao carregar transações: {e}")
         return pd.DataFrame()
 
-    conn = get_db_connection()
+
+@dataclass(frozen=True)
+class TransactionPage:
+    """
+    Uma página da tabela de transações. `next_cursor` é o cursor da página
+    seguinte (None na última) e deve ser passado como `after`.
+    """
+    rows: pd.DataFrame
+    next_cursor: tuple | None
+
+
+def _sort_expression(layout: schema.TableLayout, sort: str) -> str:
+    """Expressão SQL da coluna lógica `sort` (uma das chaves de TABLE_SORT_LABELS)."""
+    if sort == "data_hora":
+        return layout.date_column
+    if sort == "valor":
+        return layout.amount_column
+    if sort in ("descricao", "banco"):
+        # Sem NULL: a comparação do cursor com NULL descartaria linhas.
+        return f"COALESCE({sort}, '')"
+    raise ValueError(f"Coluna de ordenação inválida: {sort}")
+
+
+def get_transactions_page(
+    username: str,
+    start: date | datetime | None = None,
+    end: date | datetime | None = None,
+    sort: str = "data_hora",
+    descending: bool = True,
+    after: tuple | None = None,
+    page_size: int = TABLE_PAGE_SIZE,
+) -> TransactionPage:
+    """
+    Página de até `page_size` transações do período, ordenadas por (`sort`,
+    id). A paginação é por cursor: `after` é o (valor de `sort`, id) da última
+    linha da página anterior, e o SQL continua a partir dele pelo índice, sem
+    OFFSET — ler a página 1000 custa o mesmo que a primeira.
+    """
+    def load() -> TransactionPage:
+        with _user_connection(username) as (conn, layout):
+            if not layout:
+                return TransactionPage(pd.DataFrame(), None)
+            key = _sort_expression(layout, sort)
+            direction = "DESC" if descending else "ASC"
+            where, params = _transaction_filters(layout, start, end)
+            if after is not None:
+                clause = f"({key}, id) {'<' if descending else '>'} (?, ?)"
+                where = f"{where} AND {clause}" if where else f"WHERE {clause}"
+                params += list(after)
+            # Uma linha a mais só para saber se existe página seguinte.
+            df = pd.read_sql_query(
+                f"""
+                SELECT id, {', '.join(layout.columns)}, {key} AS chave_ordem
+                FROM {layout.table}
+                {where}
+                ORDER BY {key} {direction}, id {direction}
+                LIMIT ?
+                """,
+                conn,
+                params=[*params, page_size + 1],
+            )
+        next_cursor = None
+        if len(df) > page_size:
+            df = df.iloc[:page_size]
+            next_cursor = (df['chave_ordem'].tolist()[-1], df['id'].tolist()[-1])
+        return TransactionPage(_decode_frame(layout, df.drop(columns='chave_ordem')), next_cursor)
+
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT name FROM sqlite_master WHERE type='table' AND name=?",
-            (table_name,)
+        query = ("pagina", start, end, sort, descending, after, page_size)
+        return _cached_read(username, query, load)
+    except Exception as e:
+        st.error(f"Erro ao carregar transações: {e}")
+        return TransactionPage(pd.DataFrame(), None)
+
+
+def iter_transactions(
+    username: str,
+    start: date | datetime | None = None,
+    end: date | datetime | None = None,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+) -> Iterator[pd.DataFrame]:
+    """
+    Transações do período em blocos de até `chunk_rows` linhas, mais recentes
+    primeiro, no formato de `get_transactions_for_user`. Lê direto do SQLite,
+    sem passar pelo cache: usado pelas exportações, que não devem manter o
+    histórico inteiro em memória. A conexão fica reservada até o fim da iteração.
+    """
+    with _user_connection(username) as (conn, layout):
+        if not layout:
+            return
+        where, params = _transaction_filters(layout, start, end)
+        chunks = pd.read_sql_query(
+            _select_transactions_sql(layout, where), conn, params=params, chunksize=chunk_rows
         )
-        if cursor.fetchone() is None:
-            return pd.DataFrame()
+        for chunk in chunks:
+            yield _decode_frame(layout, chunk)
 
-        df = pd.read_sql_query(
-            f"""
-            SELECT id, tipo, valor, tipo_cartao, banco, descricao, categoria, data_hora
-            FROM {table_name}
-            ORDER BY data_hora DESC, id DESC
-            """,
-            conn
+
+def _parse_amount(text: str) -> float | None:
+    """Lê '45', '45,90', '1.234,56' ou '45.90' como valor em reais (None se não for número)."""
+    text = text.replace("R$", "").strip()
+    if "," in text:
+        text = text.replace(".", "").replace(",", ".")
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def search_transactions(
+    username: str,
+    query: str = "",
+    start: date | datetime | None = None,
+    end: date | datetime | None = None,
+    limit: int = EDIT_SEARCH_LIMIT,
+) -> pd.DataFrame:
+    """
+    Busca para o seletor de edição: casa `query` com o id ('#123' ou '123'),
+    com um trecho da descrição ou com o valor exato, dentro do período, e
+    retorna no máximo `limit` transações, mais recentes primeiro. Sem `query`,
+    retorna as `limit` mais recentes do período.
+    """
+    def load() -> pd.DataFrame:
+        with _user_connection(username) as (conn, layout):
+            if not layout:
+                return pd.DataFrame()
+            where, params = _transaction_filters(layout, start, end)
+            text = query.strip()
+            if text:
+                matches = ["descricao LIKE ? ESCAPE '\\'"]
+                escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                search_params: list = [f"%{escaped}%"]
+                if text.lstrip("#").isdigit():
+                    matches.append("id = ?")
+                    search_params.append(int(text.lstrip("#")))
+                amount = _parse_amount(text)
+                if amount is not None:
+                    matches.append("valor_cents = ?" if layout.compact else "ROUND(valor, 2) = ?")
+                    search_params.append(layout.encode_amount(round(amount, 2)))
+                clause = f"({' OR '.join(matches)})"
+                where = f"{where} AND {clause}" if where else f"WHERE {clause}"
+                params += search_params
+            return _read_transactions(conn, layout, where, [*params, limit], "LIMIT ?")
+
+    return _cached_read(username, ("busca", query.strip(), start, end, limit), load)
+
+
+def count_transactions(username: str, **filters) -> int:
+    """Conta as transações do usuário que atendem aos filtros de `_transaction_filters`."""
+    def load() -> int:
+        with _user_connection(username) as (conn, layout):
+            if not layout:
+                return 0
+            where, params = _transaction_filters(layout, **filters)
+            row = conn.execute(f"SELECT COUNT(*) FROM {layout.table} {where}", params).fetchone()
+        return row[0]
+
+    return _cached_read(username, ("contagem", *sorted(filters.items())), load)
+
+
+def summarize_transactions(
+    username: str,
+    start: date | datetime | None = None,
+    end: date | datetime | None = None,
+) -> dict[str, float]:
+    """Soma dos valores por tipo ('receita', 'gasto', 'investimento') no período."""
+    def load() -> dict[str, float]:
+        with _user_connection(username) as (conn, layout):
+            if not layout:
+                return {}
+            where, params = _transaction_filters(layout, start, end)
+            rows = conn.execute(
+                f"""
+                SELECT tipo, SUM({layout.amount_column}) AS total
+                FROM {layout.table} {where}
+                GROUP BY tipo
+                """,
+                params,
+            ).fetchall()
+        scale = 100 if layout.compact else 1
+        return {row['tipo']: row['total'] / scale for row in rows}
+
+    return dict(_cached_read(username, ("totais", start, end), load))
+
+
+# ---------------------------------------------------------------------------
+# Sincronização incremental
+# ---------------------------------------------------------------------------
+#
+# O histórico completo de cada usuário fica no cache de leituras junto com o
+# cursor do log de alterações (ver modules/schema.py). Depois de uma escrita,
+# só as linhas inseridas, alteradas ou removidas desde o cursor são lidas e
+# mescladas no DataFrame existente, em vez de recarregar a tabela inteira.
+
+@dataclass
+class TransactionDelta:
+    """Alterações desde um cursor: linhas novas ou alteradas, ids removidos e o novo cursor."""
+    upserted: pd.DataFrame
+    deleted: list[int]
+    cursor: int
+
+
+def get_transactions_since(username: str, cursor: int) -> TransactionDelta:
+    """
+    Transações inseridas, alteradas ou removidas depois de `cursor` (0 = desde
+    sempre, mas sem as linhas anteriores ao log). As linhas vêm no mesmo formato
+    de `get_transactions_for_user`; o log e as linhas são lidos na mesma
+    transação, então o cursor devolvido é consistente com elas.
+    """
+    with _user_connection(username) as (conn, layout):
+        if not layout:
+            return TransactionDelta(pd.DataFrame(), [], cursor)
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        log = schema.changelog_table_name(layout.table)
+        scope, params = layout.scope()
+        where = " AND ".join(["seq > ?", *scope])
+        changes = conn.execute(
+            f"SELECT seq, transacao_id, operacao FROM {log} WHERE {where}",
+            [cursor, *params],
+        ).fetchall()
+        upserted = _read_transactions(
+            conn, layout,
+            f"WHERE id IN (SELECT transacao_id FROM {log} WHERE {where} AND operacao != 'D')",
+            [cursor, *params],
         )
-        if not df.empty:
-            df['data_hora_dt'] = pd.to_datetime(df['data_hora'])
-        return df
+    return TransactionDelta(
+        upserted=upserted,
+        deleted=[row['transacao_id'] for row in changes if row['operacao'] == 'D'],
+        cursor=max((row['seq'] for row in changes), default=cursor),
+    )
+
+
+@dataclass
+class _SyncedFrame:
+    """Histórico completo de um usuário no cache, com a posição no log de alterações."""
+    frame: pd.DataFrame
+    table: str
+    cursor: int
+    version: int
+
+    def __sizeof__(self) -> int:
+        return cache.estimate_size(self.frame)
+
+
+def _load_synced_frame(username: str, version: int) -> _SyncedFrame | None:
+    with _user_connection(username) as (conn, layout):
+        if not layout:
+            return None
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        log = schema.changelog_table_name(layout.table)
+        cursor = conn.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {log}").fetchone()[0]
+        where, params = _transaction_filters(layout)
+        frame = _read_transactions(conn, layout, where, params)
+    return _SyncedFrame(frame, layout.table, cursor, version)
+
+
+def _merge_delta(frame: pd.DataFrame, delta: TransactionDelta) -> pd.DataFrame:
+    """Aplica um delta ao histórico, mantendo a ordem (data_hora_dt, id) decrescente."""
+    touched = list(delta.deleted)
+    if not delta.upserted.empty:
+        touched += delta.upserted['id'].tolist()
+    kept = frame[~frame['id'].isin(touched)]
+    if delta.upserted.empty:
+        return kept.reset_index(drop=True)
+    if kept.empty:
+        return delta.upserted
+    # Categorias diferentes nos dois lados fazem o concat voltar a texto.
+    merged = _categorize(pd.concat([kept, delta.upserted], ignore_index=True))
+    return merged.sort_values(['data_hora_dt', 'id'], ascending=False, ignore_index=True)
+
+
+def get_synced_transactions(username: str) -> pd.DataFrame:
+    """
+    Histórico completo do usuário, mais recentes primeiro. Sem escritas desde a
+    última chamada responde do cache sem tocar no SQLite; depois de uma escrita
+    lê apenas o delta do log de alterações e o mescla ao DataFrame guardado.
+    """
+    key = (username, _HISTORY_KEY)
+    version = data_version(username)
+    synced = _read_cache.get(key)
+
+    try:
+        if synced is None or synced.table != get_or_create_user_finance_table_name(username):
+            synced = _load_synced_frame(username, version)
+            if synced is None:
+                return pd.DataFrame()
+        elif synced.version != version:
+            delta = get_transactions_since(username, synced.cursor)
+            synced = _SyncedFrame(_merge_delta(synced.frame, delta), synced.table, delta.cursor, version)
+        else:
+            return synced.frame.copy(deep=False)
     except Exception as e:
         st.error(f"Erro ao carregar transações: {e}")
         return pd.DataFrame()
-    finally:
-        conn.close()
 
+    _read_cache.put(key, synced)
+    return synced.frame.copy(deep=False)
 
-def bulk_insert_transactions(username: str, df_transactions: pd.DataFrame) -> tuple[int, int]:
-    """Insere múltiplas transações a partir de um DataFrame."""
-    table_name = get_or_create_user_finance_table_name(username)
-    if not table_name:
-        return 0, len(df_transactions)
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    ok, fail = 0, 0
+# ---------------------------------------------------------------------------
+# Resumo mensal
+# ---------------------------------------------------------------------------
 
-    for index, row in df_transactions.iterrows():
-        try:
-            raw_date = str(row['data_hora']).strip()
-            dt_obj = None
-            for fmt in (UPLOAD_DATETIME_FORMAT, UPLOAD_DATE_FORMAT):
-                try:
-                    dt_obj = datetime.strptime(raw_date, fmt)
-                    break
-                except ValueError:
-                    continue
-            if dt_obj is None:
-                st.warning(f"Formato de data inválido na linha {index + 2}: '{raw_date}'. Pulando.")
-                fail += 1
-                continue
+def get_monthly_rollup(
+    username: str,
+    start: date | None = None,
+    end: date | None = None,
+) -> pd.DataFrame:
+    """
+    Linhas do resumo mensal (mes, tipo, categoria, banco, total, quantidade)
+    dos meses entre `start` e `end`, inclusive. Só o mês das datas é considerado.
+    """
+    def load() -> pd.DataFrame:
+        with _user_connection(username) as (conn, layout):
+            if not layout:
+                return pd.DataFrame()
+            clauses, params = layout.scope()
+            if start is not None:
+                clauses.append("mes >= ?")
+                params.append(start.strftime('%Y-%m'))
+            if end is not None:
+                clauses.append("mes <= ?")
+                params.append(end.strftime('%Y-%m'))
+            where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+            return pd.read_sql_query(
+                f"""
+                SELECT mes, tipo, categoria, banco, {layout.rollup_total_sql} AS total, quantidade
+                FROM {layout.rollup_table}
+                {where}
+                """,
+                conn,
+                params=params,
+            )
 
-            cursor.execute(f"""
-                INSERT INTO {table_name}
-                    (tipo, valor, tipo_cartao, banco, descricao, categoria, data_hora)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                str(row['tipo']).lower(),
-                float(row['valor']),
-                str(row.get('tipo_cartao', '')).lower().replace(' ', '_').replace('/', '_'),
-                str(row.get('banco', '')).strip(),
-                str(row.get('descricao', '')).strip(),
-                str(row.get('categoria', '')).strip(),
-                dt_obj.strftime('%Y-%m-%d %H:%M:%S'),
-            ))
-            ok += 1
-        except Exception as e:
-            st.error(f"Erro na linha {index + 2}: {e}")
-            fail += 1
-            conn.rollback()
+    return _cached_read(username, ("resumo_mensal", start, end), load)
+
+
+def rebuild_monthly_rollup(username: str) -> None:
+    """Recalcula do zero o resumo mensal do usuário a partir das transações."""
+    with _user_connection(username) as (conn, layout):
+        if not layout:
+            return
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        schema.rebuild_rollup(conn.cursor(), layout.table, layout.user_id)
+    _bump_data_version(username)
+
+
+def verify_monthly_rollup(username: str, tolerance: float = 0.005) -> pd.DataFrame:
+    """
+    Compara o resumo mensal com as transações e retorna as chaves divergentes
+    (colunas total/quantidade do resumo e *_real calculadas das transações).
+    Um DataFrame vazio significa que o resumo está consistente.
+    """
+    key = ["mes", "tipo", "categoria", "banco"]
+    with _user_connection(username) as (conn, layout):
+        if not layout:
+            return pd.DataFrame()
+        scope, params = layout.scope()
+        where = f"WHERE {' AND '.join(scope)}" if scope else ""
+        expected = pd.read_sql_query(
+            f"""
+            SELECT {layout.month_sql()} AS mes, tipo,
+                   COALESCE(categoria, '') AS categoria, COALESCE(banco, '') AS banco,
+                   SUM({layout.amount_sql()}) AS total_real, COUNT(*) AS quantidade_real
+            FROM {layout.table}
+            {where}
+            GROUP BY 1, 2, 3, 4
+            """,
+            conn,
+            params=params,
+        )
+        stored = pd.read_sql_query(
+            f"""
+            SELECT {', '.join(key)}, {layout.rollup_total_sql} AS total, quantidade
+            FROM {layout.rollup_table}
+            {where}
+            """,
+            conn,
+            params=params,
+        )
+
+    merged = stored.merge(expected, on=key, how="outer")
+    merged[["total", "total_real"]] = merged[["total", "total_real"]].fillna(0.0)
+    merged[["quantidade", "quantidade_real"]] = merged[["quantidade", "quantidade_real"]].fillna(0)
+    diverges = (
+        ((merged["total"] - merged["total_real"]).abs() > tolerance)
+        | (merged["quantidade"] != merged["quantidade_real"])
+    )
+    return merged[diverges].reset_index(drop=True)
+
+
+# ---------------------------------------------------------------------------
+# Importação em lote
+# ---------------------------------------------------------------------------
+
+@dataclass
+class BulkInsertResult:
+    """Resultado de uma importação: linhas gravadas e relatório das rejeitadas."""
+    inserted: int = 0
+    rejected: pd.DataFrame = field(
+        default_factory=lambda: pd.DataFrame(columns=["linha", "motivo"])
+    )
+
+    @property
+    def failed(self) -> int:
+        return len(self.rejected)
+
+
+def _clean_text(df: pd.DataFrame, column: str) -> pd.Series:
+    if column not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    # astype(object) antes do fillna: colunas categóricas (Parquet) não aceitam "".
+    return df[column].astype(object).fillna("").astype(str).str.strip()
+
+
+def _parse_upload_dates(raw: pd.Series) -> pd.Series:
+    """Converte a coluna data_hora do upload, aceitando os dois formatos do modelo."""
+    if pd.api.types.is_datetime64_any_dtype(raw):
+        return raw
+    text = raw.astype("string").str.strip()
+    parsed = pd.to_datetime(text, format=UPLOAD_DATETIME_FORMAT, errors="coerce")
+    missing = parsed.isna()
+    if missing.any():
+        parsed.loc[missing] = pd.to_datetime(text[missing], format=UPLOAD_DATE_FORMAT, errors="coerce")
+    return parsed
+
+
+def _prepare_upload_rows(
+    df_transactions: pd.DataFrame, first_line: int
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Valida e normaliza o upload coluna a coluna.
+    Retorna (linhas válidas com `valor` float e `data_hora` datetime64,
+    relatório de rejeições).
+    """
+    lines = pd.Series(np.arange(len(df_transactions)) + first_line, index=df_transactions.index)
+
+    tipo = _clean_text(df_transactions, "tipo").str.lower()
+    valor = pd.to_numeric(df_transactions["valor"], errors="coerce")
+    data_hora = _parse_upload_dates(df_transactions["data_hora"])
+
+    bad_date = data_hora.isna().to_numpy()
+    date_reason = "Formato de data inválido"
+    if bad_date.any():
+        raw_dates = df_transactions["data_hora"].astype(str).to_numpy(dtype=object)
+        date_reason = "Formato de data inválido: '" + raw_dates + "'"
+    reasons = np.select(
+        [bad_date, valor.isna().to_numpy(), (tipo == "").to_numpy()],
+        [date_reason, "Valor não numérico", "Tipo vazio"],
+        default="",
+    )
+    rejected_mask = reasons != ""
+    rejected = pd.DataFrame({
+        "linha": lines[rejected_mask].to_numpy(),
+        "motivo": reasons[rejected_mask],
+    })
+
+    valid = ~rejected_mask
+    rows = pd.DataFrame({
+        "tipo": tipo[valid],
+        "valor": valor[valid].astype(float),
+        "tipo_cartao": _clean_text(df_transactions, "tipo_cartao")[valid]
+            .str.lower().str.replace(r"[ /]", "_", regex=True),
+        "banco": _clean_text(df_transactions, "banco")[valid],
+        "descricao": _clean_text(df_transactions, "descricao")[valid],
+        "categoria": _clean_text(df_transactions, "categoria")[valid],
+        "data_hora": data_hora[valid],
+    })
+    return rows, rejected
+
+
+def _encode_upload_rows(layout: schema.TableLayout, rows: pd.DataFrame) -> list[list]:
+    """Colunas de `layout.insert_columns`, como listas, para o executemany."""
+    if layout.compact:
+        amount = (rows["valor"] * 100).round().astype("int64")
+        when = rows["data_hora"].astype("datetime64[s]").astype("int64")
+    else:
+        amount = rows["valor"]
+        when = rows["data_hora"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    owner = [[value] * len(rows) for value in layout.owner_values]
+    return [
+        *owner,
+        rows["tipo"].tolist(),
+        amount.tolist(),
+        rows["tipo_cartao"].tolist(),
+        rows["banco"].tolist(),
+        rows["descricao"].tolist(),
+        rows["categoria"].tolist(),
+        when.tolist(),
+    ]
+
+
+def bulk_insert_transactions(
+    username: str, df_transactions: pd.DataFrame, first_line: int = 2
+) -> BulkInsertResult:
+    """
+    Insere múltiplas transações a partir de um DataFrame.
+
+    Datas e campos de texto são normalizados de forma vetorizada (colunas já
+    tipadas, como datetime64 e float vindos de um Parquet, passam sem parsing);
+    as linhas válidas são gravadas com um único executemany dentro de uma transação, e
+    as inválidas voltam em `BulkInsertResult.rejected` com o número da linha
+    no arquivo (`first_line` é a linha do primeiro registro, após o cabeçalho).
+    """
+    if not get_or_create_user_finance_table_name(username):
+        return BulkInsertResult(rejected=pd.DataFrame({
+            "linha": np.arange(len(df_transactions)) + first_line,
+            "motivo": "Tabela do usuário indisponível",
+        }))
+
+    rows, rejected = _prepare_upload_rows(df_transactions, first_line)
+    if rows.empty:
+        return BulkInsertResult(rejected=rejected)
+
+    try:
+        with _user_connection(username) as (conn, layout):
+            conn.executemany(f"""
+                INSERT INTO {layout.table} ({', '.join(layout.insert_columns)})
+                VALUES ({', '.join('?' * len(layout.insert_columns))})
+            """, zip(*_encode_upload_rows(layout, rows)))
+    except Exception as e:
+        st.error(f"Erro ao gravar transações em lote: {e}")
+        failed_lines = np.arange(len(df_transactions)) + first_line
+        failed_lines = failed_lines[~np.isin(failed_lines, rejected["linha"].to_numpy())]
+        db_failures = pd.DataFrame({"linha": failed_lines, "motivo": f"Erro no banco: {e}"})
+        return BulkInsertResult(
+            rejected=pd.concat([rejected, db_failures], ignore_index=True).sort_values("linha")
+        )
 
-    if ok > 0:
-        conn.commit()
-    conn.close()
-    return ok, fail
\ No newline at end of file
+    _bump_data_version(username)
+    return BulkInsertResult(inserted=len(rows), rejected=rejected)
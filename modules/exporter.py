@@ -0,0 +1,113 @@
+# modules/exporter.py
+import io
+from datetime import date
+from typing import Iterator
+
+import pandas as pd
+import pyarrow as pa  # type: ignore
+import pyarrow.parquet as pq  # type: ignore
+
+from .config import EXPECTED_UPLOAD_COLUMNS, UPLOAD_DATETIME_FORMAT, EXPORT_CHUNK_ROWS
+from . import db_utils
+
+
+# ---------------------------------------------------------------------------
+# Exportação em blocos
+# ---------------------------------------------------------------------------
+#
+# As exportações só são geradas quando o usuário pede o download e leem o
+# SQLite em blocos de EXPORT_CHUNK_ROWS linhas (db_utils.iter_transactions),
+# escrevendo cada bloco no arquivo de saída antes de ler o próximo — o
+# histórico nunca é montado inteiro como DataFrame. Todas usam as colunas de
+# EXPECTED_UPLOAD_COLUMNS, então o arquivo pode ser importado de volta.
+
+# formato → (rótulo, extensão, MIME)
+EXPORT_FORMATS = {
+    "csv": ("CSV", "csv", "text/csv"),
+    "parquet": ("Parquet", "parquet", "application/vnd.apache.parquet"),
+    "xlsx": ("Excel (XLSX)", "xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+_PARQUET_SCHEMA = pa.schema([
+    ("tipo", pa.string()),
+    ("valor", pa.float64()),
+    ("tipo_cartao", pa.string()),
+    ("banco", pa.string()),
+    ("descricao", pa.string()),
+    ("categoria", pa.string()),
+    ("data_hora", pa.timestamp("s")),
+])
+
+_TEXT_COLUMNS = ["tipo", "tipo_cartao", "banco", "descricao", "categoria"]
+
+# Limite de linhas de uma planilha do Excel (o cabeçalho ocupa a primeira)
+_XLSX_MAX_ROWS = 1_048_576
+
+
+def _export_chunks(
+    username: str, start: date | None, end: date | None, chunk_rows: int
+) -> Iterator[pd.DataFrame]:
+    """Blocos no layout de EXPECTED_UPLOAD_COLUMNS, com data_hora como datetime64."""
+    for chunk in db_utils.iter_transactions(username, start, end, chunk_rows):
+        chunk = chunk.rename(columns={"data_hora_dt": "data_hora"})[EXPECTED_UPLOAD_COLUMNS]
+        yield chunk.astype({col: object for col in _TEXT_COLUMNS})
+
+
+def _write_csv(chunks: Iterator[pd.DataFrame], out: io.BytesIO) -> None:
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    header = True
+    for chunk in chunks:
+        chunk.assign(data_hora=chunk["data_hora"].dt.strftime(UPLOAD_DATETIME_FORMAT)).to_csv(
+            text, index=False, header=header
+        )
+        header = False
+    if header:
+        text.write(",".join(EXPECTED_UPLOAD_COLUMNS) + "\n")
+    text.flush()
+    text.detach()
+
+
+def _write_parquet(chunks: Iterator[pd.DataFrame], out: io.BytesIO) -> None:
+    # Cada bloco vira um row group; a importação lê o arquivo na mesma granularidade.
+    with pq.ParquetWriter(out, _PARQUET_SCHEMA, compression="zstd") as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema=_PARQUET_SCHEMA, preserve_index=False))
+
+
+def _write_xlsx(chunks: Iterator[pd.DataFrame], out: io.BytesIO) -> None:
+    from openpyxl import Workbook  # type: ignore
+
+    # write_only: as linhas vão direto para o arquivo, sem manter a planilha em memória.
+    # Uma planilha nova sempre que a atual enche (e para a primeira linha).
+    workbook = Workbook(write_only=True)
+    sheet, sheet_rows = None, _XLSX_MAX_ROWS
+    for chunk in chunks:
+        for row in chunk.itertuples(index=False, name=None):
+            if sheet_rows == _XLSX_MAX_ROWS:
+                sheet = workbook.create_sheet(f"transacoes_{len(workbook.worksheets) + 1}")
+                sheet.append(EXPECTED_UPLOAD_COLUMNS)
+                sheet_rows = 1
+            sheet.append([None if pd.isna(value) else value for value in row])
+            sheet_rows += 1
+    if sheet is None:
+        workbook.create_sheet("transacoes_1").append(EXPECTED_UPLOAD_COLUMNS)
+    workbook.save(out)
+
+
+_WRITERS = {"csv": _write_csv, "parquet": _write_parquet, "xlsx": _write_xlsx}
+
+
+def export_transactions(
+    username: str,
+    fmt: str,
+    start: date | None = None,
+    end: date | None = None,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+) -> bytes:
+    """
+    Arquivo com as transações do período (inclusive, dias inteiros) no formato
+    `fmt` ("csv", "parquet" ou "xlsx"), mais recentes primeiro.
+    """
+    out = io.BytesIO()
+    _WRITERS[fmt](_export_chunks(username, start, end, chunk_rows), out)
+    return out.getvalue()
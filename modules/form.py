@@ -1,4 +1,6 @@
 # modules/form.py
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
 import streamlit as st  # type: ignore
 from datetime import datetime
 from .config import FORM_ICON, DASHBOARD_ICON, TRANSACTION_TYPES, DEFAULT_CATEGORIES
@@ -13,6 +15,50 @@ def format_currency_br(value):
         return "R$ 0,00"
 
 
+# Pedaços pré-formatados para format_currency_br_series: grupos de milhar
+# ("7", ".007") e centavos (",07"), indexados pelo próprio número.
+_BRL_GROUP = np.array([str(i) for i in range(1000)])
+_BRL_GROUP_SEP = np.array([f".{i:03d}" for i in range(1000)])
+_BRL_CENTS = np.array([f",{i:02d}" for i in range(100)])
+_THOUSANDS = 1000 ** np.arange(7, dtype=np.int64)
+# A partir deste módulo (em reais) os centavos deixam de ser exatos no float e,
+# mais acima, estouram o int64: esses valores (e ±inf) usam format_currency_br,
+# assim como os que caem a meio centavo, onde valor * 100 pode arredondar para
+# o lado errado.
+_BRL_VECTOR_LIMIT = 1e12
+
+
+def format_currency_br_series(values) -> pd.Series:
+    """
+    Versão vetorizada de format_currency_br para uma coluna (ou lista) inteira:
+    os valores viram centavos inteiros, cada grupo de milhar é buscado numa
+    tabela de textos pronta e os pedaços são concatenados pelo NumPy, sem
+    formatar valor a valor em Python. Não numéricos viram "R$ 0,00"; valores
+    fora de ±_BRL_VECTOR_LIMIT ou a meio centavo são formatados um a um por
+    format_currency_br.
+    """
+    index = values.index if isinstance(values, pd.Series) else None
+    amounts = pd.to_numeric(pd.Series(values, index=index), errors="coerce").fillna(0.0)
+    raw = amounts.to_numpy(dtype=float)
+    in_range = np.abs(raw) < _BRL_VECTOR_LIMIT
+    scaled = np.where(in_range, raw, 0.0) * 100
+    scalar = ~in_range | (np.abs(np.abs(scaled) % 1 - 0.5) < 1e-6)
+    cents = np.round(scaled).astype(np.int64)
+    negative = cents < 0
+    cents = np.abs(cents)
+    reais = cents // 100
+
+    groups = np.searchsorted(_THOUSANDS[1:], reais, side="right")  # grupos além do primeiro
+    text = _BRL_GROUP[(reais // _THOUSANDS[groups]) % 1000]
+    for k in range(int(groups.max(initial=0)) - 1, -1, -1):
+        text = np.char.add(text, np.where(groups > k, _BRL_GROUP_SEP[(reais // _THOUSANDS[k]) % 1000], ""))
+    text = np.char.add(np.char.add(np.where(negative, "R$ -", "R$ "), text), _BRL_CENTS[cents % 100])
+    if scalar.any():
+        text = text.astype(object)
+        text[scalar] = [format_currency_br(value) for value in raw[scalar]]
+    return pd.Series(text, index=amounts.index, dtype="str")
+
+
 def transaction_form_page(username):
     st.title(f"{FORM_ICON} Olá, {username}! Registre suas Finanças")
     st.subheader("Insira os detalhes de sua transação abaixo.")
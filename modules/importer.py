@@ -0,0 +1,129 @@
+# modules/importer.py
+from typing import Callable, IO
+
+import pandas as pd
+import pyarrow.parquet as pq  # type: ignore
+
+from .config import EXPECTED_UPLOAD_COLUMNS, UPLOAD_CHUNK_ROWS
+from . import db_utils
+
+
+# ---------------------------------------------------------------------------
+# Importação de CSV em blocos
+# ---------------------------------------------------------------------------
+#
+# O arquivo nunca é convertido inteiro em DataFrame: o cabeçalho e a
+# pré-visualização leem apenas as primeiras linhas, e a gravação percorre o
+# arquivo em blocos de UPLOAD_CHUNK_ROWS linhas, cada um gravado na sua
+# própria transação por db_utils.bulk_insert_transactions. Arquivos Parquet
+# (como os gerados pela exportação) são lidos por row group, com as colunas
+# já tipadas.
+
+def _rewind(file: IO) -> None:
+    if hasattr(file, "seek"):
+        file.seek(0)
+
+
+def _file_size(file: IO) -> int:
+    size = getattr(file, "size", None)
+    if size is None:
+        position = file.tell()
+        size = file.seek(0, 2)
+        file.seek(position)
+    return size
+
+
+def is_parquet(file: IO) -> bool:
+    """True se o arquivo enviado é Parquet (pela extensão do nome)."""
+    return str(getattr(file, "name", "")).lower().endswith(".parquet")
+
+
+def missing_upload_columns(file: IO) -> list[str]:
+    """Lê só o cabeçalho (ou o schema do Parquet) e retorna as colunas esperadas que faltam."""
+    _rewind(file)
+    if is_parquet(file):
+        header = pq.ParquetFile(file).schema_arrow.names
+    else:
+        header = pd.read_csv(file, nrows=0).columns
+    _rewind(file)
+    return [c for c in EXPECTED_UPLOAD_COLUMNS if c not in header]
+
+
+def read_upload_preview(file: IO, nrows: int = 5) -> pd.DataFrame:
+    """Primeiras linhas do arquivo, sem percorrer o restante."""
+    _rewind(file)
+    if is_parquet(file):
+        batch = next(pq.ParquetFile(file).iter_batches(batch_size=nrows, columns=EXPECTED_UPLOAD_COLUMNS), None)
+        preview = batch.to_pandas() if batch is not None else pd.DataFrame(columns=EXPECTED_UPLOAD_COLUMNS)
+    else:
+        preview = pd.read_csv(file, nrows=nrows, usecols=EXPECTED_UPLOAD_COLUMNS, dtype=str)
+    _rewind(file)
+    return preview[EXPECTED_UPLOAD_COLUMNS]
+
+
+def _merge_results(inserted: int, reports: list[pd.DataFrame]) -> db_utils.BulkInsertResult:
+    if not reports:
+        return db_utils.BulkInsertResult(inserted=inserted)
+    return db_utils.BulkInsertResult(
+        inserted=inserted, rejected=pd.concat(reports, ignore_index=True)
+    )
+
+
+def stream_import_csv(
+    username: str,
+    file: IO,
+    chunk_rows: int = UPLOAD_CHUNK_ROWS,
+    on_progress: Callable[[float], None] | None = None,
+) -> db_utils.BulkInsertResult:
+    """
+    Importa o CSV bloco a bloco e consolida o resultado de todos os blocos.
+    `on_progress` recebe a fração do arquivo já processada (0 a 1).
+    """
+    _rewind(file)
+    total_bytes = max(_file_size(file), 1)
+    inserted, reports = 0, []
+    first_line = 2  # linha 1 é o cabeçalho
+
+    reader = pd.read_csv(file, chunksize=chunk_rows, usecols=EXPECTED_UPLOAD_COLUMNS, dtype=str)
+    for chunk in reader:
+        result = db_utils.bulk_insert_transactions(username, chunk, first_line=first_line)
+        inserted += result.inserted
+        if result.failed:
+            reports.append(result.rejected)
+        first_line += len(chunk)
+        if on_progress is not None:
+            on_progress(min(file.tell() / total_bytes, 1.0))
+
+    _rewind(file)
+    return _merge_results(inserted, reports)
+
+
+def stream_import_parquet(
+    username: str,
+    file: IO,
+    chunk_rows: int = UPLOAD_CHUNK_ROWS,
+    on_progress: Callable[[float], None] | None = None,
+) -> db_utils.BulkInsertResult:
+    """
+    Importa o Parquet em lotes de até `chunk_rows` linhas. Valores e datas já
+    chegam tipados, então bulk_insert_transactions não precisa interpretar
+    texto. `on_progress` recebe a fração das linhas já processada (0 a 1).
+    """
+    _rewind(file)
+    parquet = pq.ParquetFile(file)
+    total_rows = max(parquet.metadata.num_rows, 1)
+    inserted, reports = 0, []
+    first_line = 2  # mesma numeração do CSV: linha 1 seria o cabeçalho
+
+    for batch in parquet.iter_batches(batch_size=chunk_rows, columns=EXPECTED_UPLOAD_COLUMNS):
+        chunk = batch.to_pandas()
+        result = db_utils.bulk_insert_transactions(username, chunk, first_line=first_line)
+        inserted += result.inserted
+        if result.failed:
+            reports.append(result.rejected)
+        first_line += len(chunk)
+        if on_progress is not None:
+            on_progress(min((first_line - 2) / total_rows, 1.0))
+
+    _rewind(file)
+    return _merge_results(inserted, reports)
@@ -0,0 +1,93 @@
+# modules/maintenance.py
+"""
+Comandos de manutenção do banco, executados fora do Streamlit:
+
+    python -m modules.maintenance verificar-resumo [--usuario NOME]
+    python -m modules.maintenance reconstruir-resumo [--usuario NOME]
+    python -m modules.maintenance compactar [--usuario NOME]
+    python -m modules.maintenance unificar [--usuario NOME]
+"""
+import argparse
+import sys
+
+from . import db_utils
+
+
+def _target_users(args) -> list[str]:
+    return [args.usuario] if args.usuario else db_utils.list_finance_users()
+
+
+def verify_rollup(args) -> int:
+    failures = 0
+    for username in _target_users(args):
+        diverging = db_utils.verify_monthly_rollup(username)
+        if diverging.empty:
+            print(f"✅ {username}: resumo mensal consistente.")
+        else:
+            failures += 1
+            print(f"❌ {username}: {len(diverging)} chave(s) divergente(s):")
+            print(diverging.to_string(index=False))
+    return 1 if failures else 0
+
+
+def rebuild_rollup(args) -> int:
+    for username in _target_users(args):
+        db_utils.rebuild_monthly_rollup(username)
+        print(f"🔄 {username}: resumo mensal reconstruído.")
+    return 0
+
+
+def compact_tables(args) -> int:
+    for username in _target_users(args):
+        converted = db_utils.compact_user_table(username)
+        if converted:
+            print(f"📦 {username}: {converted} transação(ões) convertida(s) para o formato compacto.")
+        else:
+            print(f"✅ {username}: tabela já está no formato compacto (ou vazia).")
+    return 0
+
+
+def move_to_shared(args) -> int:
+    for username in _target_users(args):
+        moved = db_utils.move_user_to_shared_table(username)
+        if moved is None:
+            print(f"✅ {username}: já usa a tabela compartilhada.")
+        else:
+            print(f"🔀 {username}: {moved} transação(ões) movida(s) para a tabela compartilhada.")
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m modules.maintenance",
+        description="Manutenção do banco do Finance Manager.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    cmd = commands.add_parser("verificar-resumo", help="compara o resumo mensal com as transações")
+    cmd.add_argument("--usuario", help="apenas este usuário (padrão: todos)")
+    cmd.set_defaults(handler=verify_rollup)
+
+    cmd = commands.add_parser("reconstruir-resumo", help="recalcula o resumo mensal do zero")
+    cmd.add_argument("--usuario", help="apenas este usuário (padrão: todos)")
+    cmd.set_defaults(handler=rebuild_rollup)
+
+    cmd = commands.add_parser(
+        "compactar", help="converte tabelas para valor_cents/ts (pode rodar com o app no ar)"
+    )
+    cmd.add_argument("--usuario", help="apenas este usuário (padrão: todos)")
+    cmd.set_defaults(handler=compact_tables)
+
+    cmd = commands.add_parser(
+        "unificar", help="move as tabelas por usuário para a tabela compartilhada `transactions`"
+    )
+    cmd.add_argument("--usuario", help="apenas este usuário (padrão: todos)")
+    cmd.set_defaults(handler=move_to_shared)
+
+    args = parser.parse_args(argv)
+    db_utils.create_initial_tables()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+# modules/nl_parser.py
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from .config import CATEGORY_KEYWORDS
+
+
+# ---------------------------------------------------------------------------
+# Parser local de transações
+# ---------------------------------------------------------------------------
+#
+# Extrai os campos de frases simples como "Gastei 45 reais no almoço hoje no
+# Nubank, débito" sem chamar o modelo. Cada campo que precisou ser adivinhado
+# (ou não foi encontrado) reduz a confiança; o chat só usa o resultado quando
+# ela passa de FAST_PARSE_MIN_CONFIDENCE e, nos demais casos, segue para o
+# agente. Frases que o parser poderia entender errado — negações, mais de um
+# número além do valor, data explícita inválida, nenhum verbo que indique o
+# tipo — não geram resultado. O texto é comparado sem acentos e em minúsculas.
+
+def _normalize(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def _has_word(text: str, words) -> bool:
+    return any(re.search(rf"\b{re.escape(_normalize(w))}\b", text) for w in words)
+
+
+_QUESTION_WORDS = ("quanto", "quantos", "quantas", "qual", "quais", "como", "mostre", "mostra", "liste", "lista")
+
+_NEGATIONS = ["não", "nunca", "nem", "jamais"]
+
+_TIPO_VERBS = {
+    "Gasto": ["gastei", "paguei", "comprei", "torrei"],
+    "Receita": ["recebi", "ganhei", "entrou", "caiu"],
+    "Investimento": ["investi", "apliquei", "aportei", "aporte"],
+}
+
+_CARD_WORDS = {
+    "Débito": ["débito", "debitei"],
+    "Crédito": ["crédito", "cartão", "parcelado", "parcelei"],
+    "Outro/Dinheiro/Pix": ["pix", "dinheiro", "espécie", "boleto", "transferência", "ted"],
+}
+
+# Valor com "R$" antes ou "reais"/"conto"/"pila" depois: sem ambiguidade
+_STRONG_AMOUNT = re.compile(
+    r"r\$\s*(\d[\d.]*(?:,\d{1,2})?)|(\d[\d.]*(?:,\d{1,2})?)\s*(?:reais|real|contos?|pilas?)\b"
+)
+# Número solto que não faz parte de uma data (dd/mm) nem de uma palavra
+_BARE_AMOUNT = re.compile(r"(?<![\w/])(\d[\d.]*(?:,\d{1,2})?)(?![\d/])")
+_DATE = re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b")
+
+# A mensagem inteira precisa ser a confirmação: "sim, mas muda o banco" não é
+_CONFIRMATION = re.compile(
+    r"\s*(sim|s|ok|isso|confirmo|confirma|confirmado|pode salvar|salva|salvar)\s*[.!]*\s*"
+)
+
+# Penalidades de confiança por campo adivinhado
+_PENALTY = {
+    "valor": 0.15,
+    "banco": 0.4,
+    "tipo_cartao": 0.3,
+    "categoria": 0.3,
+    "data_hora": 0.05,
+}
+
+
+@dataclass
+class ParsedTransaction:
+    """
+    Campos extraídos no formato de db_utils.insert_transaction, a confiança
+    (0 a 1) e os campos que foram adivinhados.
+    """
+    transaction: dict
+    confidence: float
+    guessed: list[str] = field(default_factory=list)
+
+
+def _to_amount(text: str) -> float | None:
+    """'45', '45,90', '1.234,56' ou '45.90' em reais."""
+    if "," in text:
+        text = text.replace(".", "").replace(",", ".")
+    elif re.fullmatch(r"\d{1,3}(\.\d{3})+", text):
+        text = text.replace(".", "")
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _find_amount(text: str) -> tuple[float | None, bool]:
+    """
+    (valor, certo?) — certo quando é um valor marcado com R$ ou 'reais'. Sem
+    valor quando o texto tem qualquer outro número fora de datas ("45 reais
+    no almoço e 30 no jantar"), pois pode haver mais de uma transação.
+    """
+    strong = {m.span(1) if m.group(1) else m.span(2) for m in _STRONG_AMOUNT.finditer(text)}
+    bare = {m.span(1) for m in _BARE_AMOUNT.finditer(text)}
+    if len(strong) > 1 or len(bare | strong) != 1:
+        return None, False
+    start, end = next(iter(strong or bare))
+    return _to_amount(text[start:end]), bool(strong)
+
+
+def _find_date(text: str, now: datetime) -> datetime | None:
+    """
+    Data de "hoje", "ontem", "anteontem" ou dd/mm[/aaaa], no horário de `now`;
+    None se o texto não cita data. Levanta ValueError para datas inválidas.
+    """
+    if _has_word(text, ["anteontem"]):
+        return now - timedelta(days=2)
+    if _has_word(text, ["ontem"]):
+        return now - timedelta(days=1)
+    if _has_word(text, ["hoje", "agora"]):
+        return now
+    match = _DATE.search(text)
+    if match:
+        day, month, year = match.groups()
+        year = int(year) if year else now.year
+        if year < 100:
+            year += 2000
+        return now.replace(year=year, month=int(month), day=int(day))
+    return None
+
+
+def _find_category(text: str, tipo: str) -> tuple[str | None, str | None]:
+    """(categoria, palavra-chave encontrada) do tipo, ou (None, None)."""
+    for categoria, keywords in CATEGORY_KEYWORDS.get(tipo, {}).items():
+        for keyword in keywords:
+            if _has_word(text, [keyword]):
+                return categoria, keyword
+    return None, None
+
+
+def _find_one(text: str, options: dict[str, list[str]]) -> str | None:
+    """A única chave de `options` cujas palavras aparecem no texto (None se nenhuma ou várias)."""
+    found = [key for key, words in options.items() if _has_word(text, words)]
+    return found[0] if len(found) == 1 else None
+
+
+def is_confirmation(text: str) -> bool:
+    """True para respostas curtas de confirmação ("sim", "pode salvar", "confirma"...)."""
+    return bool(_CONFIRMATION.fullmatch(_normalize(text)))
+
+
+def parse_transaction(
+    text: str, known_banks: list[str], now: datetime | None = None
+) -> ParsedTransaction | None:
+    """
+    Extrai uma transação de `text`. Retorna None quando o texto não parece
+    descrever uma única transação (pergunta, negação, nenhum ou vários
+    valores, sem verbo que indique o tipo, data inválida).
+    `known_banks` são os bancos já usados pelo usuário; só eles são reconhecidos.
+    """
+    now = now or datetime.now()
+    norm = _normalize(text)
+    if "?" in norm or norm.split(" ", 1)[0] in _QUESTION_WORDS or _has_word(norm, _NEGATIONS):
+        return None
+
+    guessed = []
+    valor, sure = _find_amount(norm)
+    if valor is None or valor <= 0:
+        return None
+    if not sure:
+        guessed.append("valor")
+
+    # O tipo decide sinal e categoria: sem um verbo que o indique, fica com o agente.
+    tipo = _find_one(norm, _TIPO_VERBS)
+    if tipo is None:
+        return None
+
+    categoria, keyword = _find_category(norm, tipo)
+    if categoria is None:
+        categoria = "Outros"
+        guessed.append("categoria")
+
+    banks = [b for b in known_banks if b and _has_word(norm, [b])]
+    banco = banks[0] if len(banks) == 1 else ""
+    if not banco:
+        guessed.append("banco")
+
+    tipo_cartao = _find_one(norm, _CARD_WORDS)
+    if tipo_cartao is None:
+        tipo_cartao = "Outro/Dinheiro/Pix"
+        if tipo == "Gasto":
+            guessed.append("tipo_cartao")
+
+    try:
+        data_hora = _find_date(norm, now)
+    except ValueError:
+        return None
+    if data_hora is None:
+        data_hora = now
+        guessed.append("data_hora")
+
+    transaction = {
+        "tipo": tipo,
+        "valor": round(valor, 2),
+        "tipo_cartao": tipo_cartao,
+        "banco": banco,
+        "descricao": keyword.capitalize() if keyword else categoria,
+        "categoria": categoria,
+        "data_hora": data_hora.replace(microsecond=0),
+    }
+    confidence = max(0.0, 1.0 - sum(_PENALTY[name] for name in guessed))
+    return ParsedTransaction(transaction, round(confidence, 2), guessed)
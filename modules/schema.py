@@ -0,0 +1,446 @@
+# modules/schema.py
+import calendar
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, NamedTuple
+
+
+# ---------------------------------------------------------------------------
+# Formatos de armazenamento
+# ---------------------------------------------------------------------------
+#
+# Tabelas clássicas guardam `valor REAL` e `data_hora TEXT` ('%Y-%m-%d %H:%M:%S').
+# Tabelas compactas guardam `valor_cents INTEGER` e `ts INTEGER` (segundos desde
+# 1970-01-01, tratando o horário local como UTC — só a ordenação e o calendário
+# importam). O formato é detectado pelas colunas da tabela.
+#
+# A tabela compartilhada `transactions` guarda as transações de todos os
+# usuários no formato compacto, com a coluna `user_id` (de usuarios_financas)
+# à frente de todos os índices e do resumo mensal.
+
+SHARED_TABLE = "transactions"
+
+
+@dataclass(frozen=True)
+class TableLayout:
+    """
+    Como as transações de uma tabela estão gravadas. Em tabelas compartilhadas,
+    `user_id` identifica o dono das linhas (None quando o layout descreve a
+    tabela inteira, como nas migrações).
+    """
+    table: str
+    compact: bool = False
+    shared: bool = False
+    user_id: int | None = None
+
+    @property
+    def date_column(self) -> str:
+        return "ts" if self.compact else "data_hora"
+
+    @property
+    def amount_column(self) -> str:
+        return "valor_cents" if self.compact else "valor"
+
+    @property
+    def columns(self) -> tuple[str, ...]:
+        """Colunas gravadas (exceto id), na ordem usada pelos INSERT/UPDATE."""
+        return (
+            "tipo", self.amount_column, "tipo_cartao", "banco", "descricao", "categoria",
+            self.date_column,
+        )
+
+    @property
+    def owner_columns(self) -> tuple[str, ...]:
+        """Colunas que identificam o dono da linha (vazio em tabelas por usuário)."""
+        return ("user_id",) if self.shared else ()
+
+    @property
+    def owner_values(self) -> tuple:
+        return (self.user_id,) if self.shared else ()
+
+    @property
+    def insert_columns(self) -> tuple[str, ...]:
+        return self.owner_columns + self.columns
+
+    def scope(self) -> tuple[list[str], list]:
+        """Cláusulas WHERE (e parâmetros) que restringem a tabela ao dono do layout."""
+        if self.shared:
+            return ["user_id = ?"], [self.user_id]
+        return [], []
+
+    @property
+    def rollup_table(self) -> str:
+        return rollup_table_name(self.table)
+
+    @property
+    def rollup_key_columns(self) -> tuple[str, ...]:
+        return self.owner_columns + ("mes", "tipo", "categoria", "banco")
+
+    def amount_sql(self, row: str = "") -> str:
+        """Expressão SQL do valor em reais."""
+        prefix = f"{row}." if row else ""
+        return f"{prefix}valor_cents / 100.0" if self.compact else f"{prefix}valor"
+
+    @property
+    def rollup_total_sql(self) -> str:
+        """Expressão SQL do total do resumo mensal em reais."""
+        return "total / 100.0" if self.compact else "total"
+
+    def month_sql(self, row: str = "") -> str:
+        """Expressão SQL do mês ('YYYY-MM') da transação."""
+        prefix = f"{row}." if row else ""
+        if self.compact:
+            return f"strftime('%Y-%m', {prefix}ts, 'unixepoch')"
+        return f"substr({prefix}data_hora, 1, 7)"
+
+    def encode_datetime(self, dt: datetime) -> str | int:
+        if self.compact:
+            return calendar.timegm(dt.timetuple())
+        return dt.strftime('%Y-%m-%d %H:%M:%S')
+
+    def encode_amount(self, value: float) -> float | int:
+        if self.compact:
+            return int(round(float(value) * 100))
+        return float(value)
+
+
+def table_columns(cursor: sqlite3.Cursor, table_name: str) -> set[str]:
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    return {row[1] for row in cursor.fetchall()}
+
+
+def detect_layout(cursor: sqlite3.Cursor, table_name: str) -> TableLayout:
+    columns = table_columns(cursor, table_name)
+    return TableLayout(table_name, compact='ts' in columns, shared='user_id' in columns)
+
+
+# ---------------------------------------------------------------------------
+# Registro de migrações
+# ---------------------------------------------------------------------------
+#
+# Cada tabela financeira guarda em `schema_versions` o número da última
+# migração aplicada. Para alterar o schema, acrescente uma nova `Migration`
+# ao final de MIGRATIONS com o próximo número — nunca edite uma já publicada.
+# Tabelas criadas antes do registro começam na versão 0, então as migrações
+# iniciais precisam tolerar colunas que já existam. Migrações que criam
+# índices, triggers ou tabelas derivadas devem ser idempotentes e respeitar o
+# formato da tabela, pois são reaplicadas pela conversão para o formato compacto.
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Cursor, str], None]
+
+
+def _m001_create_table(cursor: sqlite3.Cursor, table_name: str) -> None:
+    if table_name == SHARED_TABLE:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id     INTEGER NOT NULL,
+                tipo        TEXT    NOT NULL,
+                valor_cents INTEGER NOT NULL,
+                tipo_cartao TEXT,
+                banco       TEXT,
+                descricao   TEXT,
+                categoria   TEXT,
+                ts          INTEGER NOT NULL
+            )
+        """)
+        return
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            id          INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo        TEXT    NOT NULL,
+            valor       REAL    NOT NULL,
+            tipo_cartao TEXT,
+            banco       TEXT,
+            descricao   TEXT,
+            data_hora   TEXT    NOT NULL
+        )
+    """)
+
+
+def _m002_add_categoria(cursor: sqlite3.Cursor, table_name: str) -> None:
+    if 'categoria' not in table_columns(cursor, table_name):
+        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN categoria TEXT")
+
+
+def _m003_add_date_indexes(cursor: sqlite3.Cursor, table_name: str) -> None:
+    layout = detect_layout(cursor, table_name)
+    owner = "".join(f"{col}, " for col in layout.owner_columns)
+    cursor.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_{table_name}_data_hora "
+        f"ON {table_name} ({owner}{layout.date_column})"
+    )
+    cursor.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_{table_name}_tipo_data_hora "
+        f"ON {table_name} ({owner}tipo, {layout.date_column})"
+    )
+
+
+# ---------------------------------------------------------------------------
+# Resumo mensal (mês, tipo, categoria, banco)
+# ---------------------------------------------------------------------------
+#
+# Mantido por triggers, então qualquer escrita na tabela de transações —
+# inclusive executemany e SQL manual — atualiza o resumo na mesma transação.
+# Categoria e banco nulos entram como '' para que a chave primária agrupe.
+# Em tabelas compactas `total` fica em centavos, como `valor_cents`; na tabela
+# compartilhada a chave começa por `user_id`.
+
+def rollup_table_name(table_name: str) -> str:
+    return f"{table_name}_resumo_mensal"
+
+
+def _rollup_key(layout: TableLayout, row: str) -> str:
+    owner = "".join(f"{row}.{col}, " for col in layout.owner_columns)
+    return (
+        f"{owner}{layout.month_sql(row)}, {row}.tipo, "
+        f"COALESCE({row}.categoria, ''), COALESCE({row}.banco, '')"
+    )
+
+
+def _rollup_add(layout: TableLayout, row: str) -> str:
+    key = ", ".join(layout.rollup_key_columns)
+    return f"""
+        INSERT INTO {layout.rollup_table} ({key}, total, quantidade)
+        VALUES ({_rollup_key(layout, row)}, {row}.{layout.amount_column}, 1)
+        ON CONFLICT ({key}) DO UPDATE
+            SET total = total + excluded.total, quantidade = quantidade + 1;
+    """
+
+
+def _rollup_remove(layout: TableLayout, row: str) -> str:
+    match = f"({', '.join(layout.rollup_key_columns)}) = ({_rollup_key(layout, row)})"
+    return f"""
+        UPDATE {layout.rollup_table}
+        SET total = total - {row}.{layout.amount_column}, quantidade = quantidade - 1
+        WHERE {match};
+        DELETE FROM {layout.rollup_table} WHERE {match} AND quantidade <= 0;
+    """
+
+
+def rebuild_rollup(cursor: sqlite3.Cursor, table_name: str, user_id: int | None = None) -> None:
+    """
+    Recalcula o resumo mensal a partir das transações — inteiro, ou só as
+    linhas de `user_id` na tabela compartilhada.
+    """
+    layout = detect_layout(cursor, table_name)
+    where, params = "", []
+    if layout.shared and user_id is not None:
+        where, params = "WHERE user_id = ?", [user_id]
+    owner = "".join(f"{col}, " for col in layout.owner_columns)
+    group_by = ", ".join(str(i) for i in range(1, len(layout.rollup_key_columns) + 1))
+    cursor.execute(f"DELETE FROM {layout.rollup_table} {where}", params)
+    cursor.execute(f"""
+        INSERT INTO {layout.rollup_table} ({', '.join(layout.rollup_key_columns)}, total, quantidade)
+        SELECT {owner}{layout.month_sql()}, tipo, COALESCE(categoria, ''), COALESCE(banco, ''),
+               SUM({layout.amount_column}), COUNT(*)
+        FROM {table_name}
+        {where}
+        GROUP BY {group_by}
+    """, params)
+
+
+def _m004_add_monthly_rollup(cursor: sqlite3.Cursor, table_name: str) -> None:
+    layout = detect_layout(cursor, table_name)
+    total_type = "INTEGER" if layout.compact else "REAL"
+    owner = "user_id    INTEGER NOT NULL," if layout.shared else ""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {layout.rollup_table} (
+            {owner}
+            mes        TEXT    NOT NULL,
+            tipo       TEXT    NOT NULL,
+            categoria  TEXT    NOT NULL,
+            banco      TEXT    NOT NULL,
+            total      {total_type} NOT NULL,
+            quantidade INTEGER NOT NULL,
+            PRIMARY KEY ({', '.join(layout.rollup_key_columns)})
+        ) WITHOUT ROWID
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table_name}_resumo_ins AFTER INSERT ON {table_name}
+        BEGIN {_rollup_add(layout, "NEW")} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table_name}_resumo_del AFTER DELETE ON {table_name}
+        BEGIN {_rollup_remove(layout, "OLD")} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table_name}_resumo_upd
+        AFTER UPDATE OF tipo, {layout.amount_column}, categoria, banco, {layout.date_column}
+        ON {table_name}
+        BEGIN {_rollup_remove(layout, "OLD")} {_rollup_add(layout, "NEW")} END
+    """)
+    rebuild_rollup(cursor, table_name)
+
+
+# ---------------------------------------------------------------------------
+# Log de alterações
+# ---------------------------------------------------------------------------
+#
+# Uma linha por transação já tocada, com o `seq` da última alteração: triggers
+# fazem INSERT OR REPLACE, então o log cresce com o número de ids e não com o
+# de escritas. Quem guarda um DataFrame lê só as linhas com `seq` maior que o
+# seu cursor ('I'/'U' para buscar de novo, 'D' para remover).
+
+def changelog_table_name(table_name: str) -> str:
+    return f"{table_name}_alteracoes"
+
+
+def _m005_add_changelog(cursor: sqlite3.Cursor, table_name: str) -> None:
+    layout = detect_layout(cursor, table_name)
+    log = changelog_table_name(table_name)
+    owner = "user_id      INTEGER NOT NULL," if layout.shared else ""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {log} (
+            seq          INTEGER PRIMARY KEY AUTOINCREMENT,
+            {owner}
+            transacao_id INTEGER NOT NULL UNIQUE,
+            operacao     TEXT    NOT NULL
+        )
+    """)
+    if layout.shared:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{log}_user_id_seq ON {log} (user_id, seq)")
+
+    for event, row, operation in (("INSERT", "NEW", "I"), ("UPDATE", "NEW", "U"), ("DELETE", "OLD", "D")):
+        columns = ", ".join((*layout.owner_columns, "transacao_id", "operacao"))
+        values = ", ".join((
+            *(f"{row}.{col}" for col in layout.owner_columns), f"{row}.id", f"'{operation}'"
+        ))
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table_name}_log_{operation.lower()}
+            AFTER {event} ON {table_name}
+            BEGIN INSERT OR REPLACE INTO {log} ({columns}) VALUES ({values}); END
+        """)
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "cria a tabela de transações", _m001_create_table),
+    Migration(2, "adiciona a coluna categoria", _m002_add_categoria),
+    Migration(3, "índices por data e por (tipo, data)", _m003_add_date_indexes),
+    Migration(4, "resumo mensal mantido por triggers", _m004_add_monthly_rollup),
+    Migration(5, "log de alterações para sincronização incremental", _m005_add_changelog),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def create_registry(cursor: sqlite3.Cursor) -> None:
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_versions (
+            tabela TEXT PRIMARY KEY,
+            versao INTEGER NOT NULL
+        )
+    """)
+
+
+def migrate_table(cursor: sqlite3.Cursor, table_name: str) -> int:
+    """
+    Aplica em ordem as migrações ainda não registradas para a tabela e
+    retorna a versão final. Deve rodar dentro de uma transação de escrita
+    para que processos concorrentes não migrem a mesma tabela duas vezes.
+    """
+    cursor.execute("SELECT versao FROM schema_versions WHERE tabela = ?", (table_name,))
+    row = cursor.fetchone()
+    current = row[0] if row else 0
+
+    for migration in MIGRATIONS:
+        if migration.version > current:
+            migration.apply(cursor, table_name)
+            current = migration.version
+
+    cursor.execute("""
+        INSERT INTO schema_versions (tabela, versao) VALUES (?, ?)
+        ON CONFLICT (tabela) DO UPDATE SET versao = excluded.versao
+    """, (table_name, current))
+    return current
+
+
+# ---------------------------------------------------------------------------
+# Conversão para o formato compacto
+# ---------------------------------------------------------------------------
+
+def convert_to_compact(cursor: sqlite3.Cursor, table_name: str) -> int:
+    """
+    Regrava a tabela no formato compacto (valor_cents, ts) preservando os ids
+    e retorna o número de linhas convertidas. Roda numa única transação de
+    escrita: com WAL os leitores continuam vendo a tabela antiga até o commit,
+    e escritores aguardam o busy timeout. Índices, triggers e o resumo mensal
+    são recriados reaplicando as migrações. Datas inválidas abortam a conversão.
+    """
+    if detect_layout(cursor, table_name).compact:
+        return 0
+
+    staging = f"{table_name}__compacta"
+    cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+    cursor.execute(f"""
+        CREATE TABLE {staging} (
+            id          INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo        TEXT    NOT NULL,
+            valor_cents INTEGER NOT NULL,
+            tipo_cartao TEXT,
+            banco       TEXT,
+            descricao   TEXT,
+            categoria   TEXT,
+            ts          INTEGER NOT NULL
+        )
+    """)
+    cursor.execute(f"""
+        INSERT INTO {staging} (id, tipo, valor_cents, tipo_cartao, banco, descricao, categoria, ts)
+        SELECT id, tipo, CAST(ROUND(valor * 100) AS INTEGER), tipo_cartao, banco, descricao,
+               categoria, CAST(strftime('%s', data_hora) AS INTEGER)
+        FROM {table_name}
+    """)
+    converted = cursor.rowcount
+
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table_name,))
+    row = cursor.fetchone()
+    last_id = row[0] if row else 0
+
+    cursor.execute(f"DROP TABLE {table_name}")
+    cursor.execute(f"DROP TABLE IF EXISTS {rollup_table_name(table_name)}")
+    cursor.execute(f"ALTER TABLE {staging} RENAME TO {table_name}")
+    cursor.execute(
+        "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (last_id, table_name)
+    )
+
+    for migration in MIGRATIONS:
+        migration.apply(cursor, table_name)
+    return converted
+
+
+# ---------------------------------------------------------------------------
+# Migração para a tabela compartilhada
+# ---------------------------------------------------------------------------
+
+def move_to_shared(cursor: sqlite3.Cursor, table_name: str, user_id: int) -> int:
+    """
+    Copia as transações de uma tabela por usuário (clássica ou compacta) para
+    a tabela compartilhada sob `user_id`, apaga a tabela antiga com seu resumo
+    e registro de versão, e retorna o número de linhas movidas. Os ids são
+    renumerados pela tabela compartilhada. A tabela compartilhada já deve
+    estar migrada; o resumo dela é alimentado pelos triggers.
+    """
+    layout = detect_layout(cursor, table_name)
+    if layout.compact:
+        amount, when = "valor_cents", "ts"
+    else:
+        amount = "CAST(ROUND(valor * 100) AS INTEGER)"
+        when = "CAST(strftime('%s', data_hora) AS INTEGER)"
+    cursor.execute(f"""
+        INSERT INTO {SHARED_TABLE}
+            (user_id, tipo, valor_cents, tipo_cartao, banco, descricao, categoria, ts)
+        SELECT ?, tipo, {amount}, tipo_cartao, banco, descricao, categoria, {when}
+        FROM {table_name}
+        ORDER BY id
+    """, (user_id,))
+    moved = cursor.rowcount
+
+    cursor.execute(f"DROP TABLE {table_name}")
+    cursor.execute(f"DROP TABLE IF EXISTS {rollup_table_name(table_name)}")
+    cursor.execute(f"DROP TABLE IF EXISTS {changelog_table_name(table_name)}")
+    cursor.execute("DELETE FROM schema_versions WHERE tabela = ?", (table_name,))
+    return moved